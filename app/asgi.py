@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+# Read heavy endpoints skip the thread Django runs sync views in
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
 
 application = get_asgi_application()
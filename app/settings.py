@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the latency it records includes the other middleware
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +59,16 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Share of requests whose latency, SQL queries and serializer time are
+#  recorded for /metrics (0 turns recording off), and the addresses allowed
+#  to read it: only loopback unless set, '*' allows any address
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0))
+METRICS_ALLOWED_IPS = [
+    ip for ip in os.environ.get(
+        'METRICS_ALLOWED_IPS', '127.0.0.1,::1'
+    ).split(',') if ip
+]
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -81,17 +93,165 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# DB_CONN_MAX_AGE keeps connections open between requests for that many
+#  seconds, DB_CONN_HEALTH_CHECKS checks a kept connection still works
+#  before using it again. DB_POOL_SIZE instead takes connections from an
+#  in-process pool, opening up to DB_POOL_MAX_OVERFLOW more under load and
+#  waiting up to DB_POOL_TIMEOUT seconds for one (see core.db)
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.backends.postgresql',
         'NAME': 'travis_ci_test',
         'USER': 'postgres',
         #'PASSWORD': '',
         'PASSWORD': '',
         'HOST': 'localhost',
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS':
+            os.environ.get('DB_CONN_HEALTH_CHECKS', '0') == '1',
+        'POOL': {
+            'SIZE': int(os.environ['DB_POOL_SIZE']),
+            'MAX_OVERFLOW': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 0)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        } if os.environ.get('DB_POOL_SIZE') else None,
+    }
+}
+
+# Read replicas of the default database, one alias (replica_1, ...) per
+#  host in the comma separated DB_REPLICA_HOSTS. Safe requests to the
+#  recipe API read from them, unless the user wrote in the last
+#  REPLICA_STICKY_SECONDS (tracked in the REPLICA_CACHE_ALIAS cache, which
+#  must be shared between processes)
+DATABASE_REPLICAS = []
+for _number, _host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica_{_number}'] = dict(
+        DATABASES['default'],
+        HOST=_host.strip(),
+        TEST={'MIRROR': 'default'}
+    )
+    DATABASE_REPLICAS.append(f'replica_{_number}')
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_CACHE_ALIAS = 'default'
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Local memory unless a shared backend (eg. memcached or redis) is configured.
+#  Local memory is kept per process, so it is only fit for tests and a
+#  single process: the features which need a shared cache refuse to start
+#  with it
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# Cache alias and timeout (seconds) for the per-user recipe API responses,
+#  off (0) unless a shared cache backend is configured
+RECIPE_API_CACHE_ALIAS = 'default'
+RECIPE_API_CACHE_TIMEOUT = int(os.environ.get(
+    'RECIPE_API_CACHE_TIMEOUT',
+    300 if os.environ.get('CACHE_BACKEND') else 0
+))
+# Most items created, updated or deleted by one bulk request
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 500))
+
+
+# Size and TTL (seconds) of the in-process token authentication cache
+TOKEN_AUTH_CACHE_SIZE = int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 10000))
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 60))
+# Lifetime (seconds) of API tokens, logging in after expiry issues a new one
+TOKEN_EXPIRE_AFTER = int(
+    os.environ.get('TOKEN_EXPIRE_AFTER', 7 * 24 * 60 * 60)
+)
+
+
+# Token bucket throttles: a client may burst up to N requests, refilling
+#  at N per period. 'user' is a client's budget across every endpoint, the
+#  others are budgets of the views with that throttle_scope
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': ['core.throttling.UserBucketThrottle'],
+}
+THROTTLE_RATES = {
+    'user': os.environ.get('THROTTLE_RATE_USER', '1200/min'),
+    'recipe': os.environ.get('THROTTLE_RATE_RECIPE', '600/min'),
+    'token': os.environ.get('THROTTLE_RATE_TOKEN', '30/min'),
+    'user_create': os.environ.get('THROTTLE_RATE_USER_CREATE', '30/hour'),
+}
+# Buckets are kept in this cache alias, each process leasing up to
+#  THROTTLE_LEASE_SIZE tokens at a time for up to THROTTLE_LOCAL_SIZE
+#  clients. With the local memory cache every process has its own buckets,
+#  so clients get the rates above once per worker process: configure a
+#  shared CACHE_BACKEND when running several
+THROTTLE_CACHE_ALIAS = 'default'
+THROTTLE_LEASE_SIZE = int(os.environ.get('THROTTLE_LEASE_SIZE', 10))
+THROTTLE_LOCAL_SIZE = int(os.environ.get('THROTTLE_LOCAL_SIZE', 10000))
+
+# Turns the throttle rates off while testing
+TEST_RUNNER = 'core.tests.runner.TestRunner'
+
+
+# Runs background tasks such as generating image renditions
+TASK_RUNNER = os.environ.get('TASK_RUNNER', 'core.tasks.ThreadPoolRunner')
+TASK_RUNNER_WORKERS = int(os.environ.get('TASK_RUNNER_WORKERS', 2))
+
+
+# Serve the read heavy recipe endpoints as async views, reading in a pool
+#  of ASYNC_VIEW_WORKERS threads, and logins in threads of their own so
+#  they wait for the password hash pool off the thread Django runs sync
+#  views in. Turned on by app/asgi.py
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '0') == '1'
+ASYNC_VIEW_WORKERS = int(os.environ.get('ASYNC_VIEW_WORKERS', 8))
+
+
+# Largest recipe image upload accepted, in bytes and pixels on a side
+MAX_IMAGE_UPLOAD_SIZE = int(
+    os.environ.get('MAX_IMAGE_UPLOAD_SIZE', 10 * 1024 * 1024)
+)
+MAX_IMAGE_DIMENSION = int(os.environ.get('MAX_IMAGE_DIMENSION', 8000))
+
+
+# Password hashing: the hasher named by PASSWORD_HASHER hashes new
+#  passwords, the others still verify older hashes, which are upgraded on
+#  the next login. 'argon2' needs the argon2-cffi package
+_PASSWORD_HASHERS = {
+    'scrypt': 'core.hashers.ScryptPasswordHasher',
+    'argon2': 'core.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'pbkdf2_sha1': 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+}
+_PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'scrypt')
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[_PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items()
+    if name != _PASSWORD_HASHER
+]
+PASSWORD_SCRYPT_WORK_FACTOR = int(
+    os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14)
+)
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(
+    os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 102400)
+)
+PASSWORD_ARGON2_PARALLELISM = int(
+    os.environ.get('PASSWORD_ARGON2_PARALLELISM', 8)
+)
+
+# Logins hash in a pool of PASSWORD_HASH_WORKERS threads, with at most
+#  PASSWORD_HASH_QUEUE more waiting PASSWORD_HASH_TIMEOUT seconds for it
+AUTHENTICATION_BACKENDS = ['core.backends.PooledModelBackend']
+PASSWORD_HASH_WORKERS = int(
+    os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+)
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -136,6 +296,20 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = './vol/web/media'
 STATIC_ROOT = './vol/web/static'
 
+# How media files are served: 'direct' sends them from the WSGI server
+#  (with sendfile where supported), 'x-accel-redirect' hands them to nginx
+#  under MEDIA_ACCEL_REDIRECT_PREFIX and 'x-sendfile' to Apache or lighttpd
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'direct')
+
+# Store recipe images named after their SHA-256, so an image uploaded to
+#  many recipes is stored once and deleted with its last recipe
+RECIPE_IMAGE_CONTENT_ADDRESSED = \
+    os.environ.get('RECIPE_IMAGE_CONTENT_ADDRESSED', '0') == '1'
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get(
+    'MEDIA_ACCEL_REDIRECT_PREFIX',
+    '/protected-media/'
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
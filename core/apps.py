@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Connect the signal receivers once the models are loaded
+        from core import signals  # noqa: F401
+        # Refuse to start with shared state kept in a single process
+        from core.cache import check_shared_caches
+        check_shared_caches()
@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Under ASGI Django runs every sync view in one shared thread. Reads run
+#  here instead, in parallel, with one db connection per worker at most
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_VIEW_WORKERS,
+    thread_name_prefix='async-view'
+)
+
+# Logins wait for their password hash here rather than in the shared
+#  thread, as many at once as the hash pool and its queue accept
+login_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE,
+    thread_name_prefix='async-login'
+)
+
+
+def _run(view, request, *args, **kwargs):
+    """ Run a view in a worker thread and render its response """
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+            # A plain response, so the handler does not go back to the
+            #  shared thread to render it again
+            rendered = HttpResponse(
+                response.content,
+                status=response.status_code,
+                headers=response.headers
+            )
+            rendered.cookies = response.cookies
+            response = rendered
+        return response
+    finally:
+        close_old_connections()
+
+
+async def _in_executor(pool, view, request, *args, **kwargs):
+    """ Run a view in the pool, awaiting its response """
+    loop = asyncio.get_running_loop()
+    # Carry the request's context (eg. its metrics) over to the thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        pool,
+        functools.partial(context.run, _run, view, request, *args, **kwargs)
+    )
+
+
+def async_read_view(view):
+    """ Wrap a sync view into an async one running reads in the executor
+
+    Django 3.2 has no async ORM, so the view itself stays synchronous and
+    its queries run in the bounded executor. Writes keep going through the
+    shared thread, as Django runs sync views.
+    """
+    write = sync_to_async(view, thread_sensitive=True)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await write(request, *args, **kwargs)
+
+        return await _in_executor(executor, view, request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_offload_view(view, pool):
+    """ Wrap a sync view into an async one running every request in the pool
+
+    For views which block on something else than their queries, such as a
+    login waiting for its password hash, so the wait never holds up the
+    shared thread the other sync views run in.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await _in_executor(pool, view, request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_read_urls(urls, names):
+    """ Make the URL patterns with the given names async read views """
+    for pattern in urls:
+        if getattr(pattern, 'name', None) in names:
+            pattern.callback = async_read_view(pattern.callback)
+
+    return urls
@@ -0,0 +1,105 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core.models import AuthToken
+
+
+class TokenCache:
+    """ Thread safe LRU cache of authenticated tokens with a TTL """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # user id -> token keys, so a user's tokens can be evicted directly
+        self._user_keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the cached (user, token) for a key or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """ Cache the (user, token) for a key, evicting the oldest entry """
+        user, token = value
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._user_keys.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        """ Evict a token """
+        with self._lock:
+            self._remove(key)
+
+    def delete_user(self, user_id):
+        """ Evict every token of a user """
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        """ Evict every token and reset the counters """
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            user_id = entry[0][0].pk
+            keys = self._user_keys.get(user_id)
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[user_id]
+
+
+token_cache = TokenCache(
+    settings.TOKEN_AUTH_CACHE_SIZE,
+    settings.TOKEN_AUTH_CACHE_TTL
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ Token authentication which caches the token and user lookup """
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            # Invalid tokens and inactive users raise and are never cached
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+
+        user, token = cached
+        # The expiry was read with the token, checking it costs no query
+        if token.is_expired():
+            token_cache.delete(key)
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+
+        # Copy the user so requests never share a mutable instance
+        return (copy.copy(user), token)
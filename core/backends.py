@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from core.hashers import check_password, get_pool
+
+
+class PooledModelBackend(ModelBackend):
+    """ Authenticate against the user model, hashing in the password pool """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user_model = get_user_model()
+        if username is None:
+            username = kwargs.get(user_model.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = user_model._default_manager.get_by_natural_key(username)
+        except user_model.DoesNotExist:
+            # Hash anyway, so unknown users take as long as wrong passwords
+            get_pool().run(user_model().set_password, password)
+            return None
+
+        if check_password(user, password) and \
+                self.user_can_authenticate(user):
+            return user
+
+        return None
@@ -0,0 +1,14 @@
+from django.db import connections, router
+
+
+def bulk_create(model, objs, batch_size=None):
+    """ Insert objects in batches and return them with their primary keys """
+    connection = connections[router.db_for_write(model)]
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs, batch_size=batch_size)
+
+    # Backends which can't return the inserted ids save one row at a time
+    for obj in objs:
+        obj.save()
+
+    return objs
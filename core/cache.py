@@ -0,0 +1,80 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+
+def get_cache():
+    """ Return the cache backend used for the recipe API responses """
+    return caches[settings.RECIPE_API_CACHE_ALIAS]
+
+
+def require_shared_cache(alias, setting):
+    """ Raise ImproperlyConfigured if the cache lives in a single process
+
+    Workers each have their own local memory cache, so state they must agree
+    on would differ from one worker to the next.
+    """
+    if isinstance(caches[alias], LocMemCache):
+        raise ImproperlyConfigured(
+            f'{setting} needs the {alias!r} cache to be shared between '
+            f'processes, set CACHE_BACKEND to eg. memcached or redis'
+        )
+
+
+def check_shared_caches():
+    """ Check the caches of the enabled features are shared """
+    if settings.RECIPE_API_CACHE_TIMEOUT:
+        require_shared_cache(
+            settings.RECIPE_API_CACHE_ALIAS,
+            'RECIPE_API_CACHE_TIMEOUT'
+        )
+    if settings.DATABASE_REPLICAS:
+        # A user's next request may reach a worker which missed their write
+        require_shared_cache(settings.REPLICA_CACHE_ALIAS, 'DB_REPLICA_HOSTS')
+
+
+def _generation_key(user_id):
+    return f'recipe-api:generation:{user_id}'
+
+
+def get_generation(user_id):
+    """ Return the current cache generation for a user """
+    # Start from the current time rather than 1 so an evicted counter can
+    #  never bring back responses cached under an older generation
+    return get_cache().get_or_set(
+        _generation_key(user_id),
+        time.time_ns,
+        timeout=None
+    )
+
+
+def bump_generation(user_id):
+    """ Invalidate every cached response for a user """
+    cache = get_cache()
+    try:
+        cache.incr(_generation_key(user_id))
+    except ValueError:
+        # The counter is missing so nothing cached for the user is reachable
+        cache.set(_generation_key(user_id), time.time_ns(), timeout=None)
+
+
+def response_cache_key(user_id, endpoint, query_params, state=''):
+    """ Return the cache key of a response for a user, endpoint and query
+
+    The state, such as the digest a list ETag is built from, ties the cached
+    response to the data it was built from.
+    """
+    # Sort the parameters so the same query always maps to the same key
+    query = '&'.join(
+        f'{name}={value}'
+        for name, values in sorted(query_params.lists())
+        for value in sorted(values)
+    )
+    digest = hashlib.md5(f'{query}:{state}'.encode()).hexdigest()
+    generation = get_generation(user_id)
+
+    return f'recipe-api:{user_id}:{generation}:{endpoint}:{digest}'
@@ -0,0 +1,121 @@
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from core.db.pool import ConnectionPool, PoolTimeout
+
+
+# Pools by database alias and connection parameters, shared by the
+#  threads of the process
+pools = {}
+_pools_lock = threading.Lock()
+
+
+def reset_connection(connection):
+    """ Roll back what a returned connection left open, False if broken """
+    if connection.closed:
+        return False
+    status = connection.info.transaction_status
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+    return True
+
+
+def check_connection(connection):
+    """ Return whether an idle connection still works """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except base.Database.Error:
+        return False
+
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """ PostgreSQL backend with health checks and an optional pool
+
+    CONN_HEALTH_CHECKS checks persistent connections (with CONN_MAX_AGE) or
+    pooled ones (with POOL) work before their first use in a request, the
+    way Django does from 4.1. POOL holds the SIZE, MAX_OVERFLOW and TIMEOUT
+    of a process wide pool the connections are taken from and returned to
+    instead of being opened and closed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        # The pool the current connection was taken from
+        self.pool = None
+
+    def get_pool(self, conn_params):
+        """ Return the pool for the connection parameters, if pooling """
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+
+        # Keyed by parameters too, the test runner renames the database
+        key = (self.alias, tuple(sorted(
+            (name, str(value)) for name, value in conn_params.items()
+        )))
+        with _pools_lock:
+            if key not in pools:
+                pools[key] = ConnectionPool(
+                    lambda: super(DatabaseWrapper, self)
+                    .get_new_connection(conn_params),
+                    size=options.get('SIZE', 10),
+                    max_overflow=options.get('MAX_OVERFLOW', 0),
+                    timeout=options.get('TIMEOUT', 30),
+                    reset=reset_connection,
+                    check=check_connection
+                    if self.settings_dict.get('CONN_HEALTH_CHECKS') else None
+                )
+
+        return pools[key]
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+
+        try:
+            return self.pool.get()
+        except PoolTimeout as error:
+            raise base.Database.OperationalError(str(error)) from error
+
+    def connect(self):
+        super().connect()
+        # A new (or checked out) connection needs no health check
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        if self.connection is not None and not self.health_check_done and \
+                self.settings_dict.get('CONN_HEALTH_CHECKS') and \
+                not self.in_atomic_block:
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # Called at the start and end of requests
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            self.pool.put(self.connection)
+
+
+def pool_stats():
+    """ Return the counters of the pools, by database alias """
+    with _pools_lock:
+        return {alias: pool.stats() for (alias, _), pool in pools.items()}
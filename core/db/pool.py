@@ -0,0 +1,141 @@
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """ Thread safe pool of db connections with an overflow limit
+
+    Up to `size` connections are kept open once returned, up to
+    `max_overflow` more are opened under load and closed when returned.
+    When all of them are in use, callers wait up to `timeout` seconds.
+    """
+
+    def __init__(self, connect, size, max_overflow=0, timeout=30,
+                 reset=None, check=None):
+        self.connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        # Called on return, False discards the connection
+        self.reset = reset
+        # Called before reusing an idle connection, False discards it
+        self.check = check
+        # Idle connections, the most recently returned (and so the most
+        #  likely to be alive and warm) are reused first
+        self._idle = []
+        self._open = 0
+        self._condition = threading.Condition()
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._timeouts = 0
+
+    def get(self):
+        """ Return an idle or new connection, waiting for one if needed """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            with self._condition:
+                while not self._idle and \
+                        self._open >= self.size + self.max_overflow:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f'No connection available within {self.timeout}s'
+                        )
+                    waited = True
+                    self._condition.wait(remaining)
+
+                connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    self._open += 1
+
+            if connection is None:
+                connection = self._new()
+            elif self.check is not None and not self.check(connection):
+                self._discard(connection)
+                continue
+
+            self._record_checkout(time.monotonic() - start, waited)
+            return connection
+
+    def put(self, connection):
+        """ Return a connection, closing it when broken or in overflow """
+        if self.reset is not None and not self._safe(self.reset, connection):
+            self._discard(connection)
+            return
+
+        with self._condition:
+            if self._open > self.size:
+                self._open -= 1
+                overflow = True
+            else:
+                self._idle.append(connection)
+                overflow = False
+            self._condition.notify()
+
+        if overflow:
+            self._safe(connection.close)
+
+    def close(self):
+        """ Close the idle connections """
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for connection in idle:
+            self._safe(connection.close)
+
+    def stats(self):
+        """ Return the counters of the pool """
+        with self._condition:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'max_wait_time': self._max_wait_time,
+                'timeouts': self._timeouts,
+            }
+
+    def _new(self):
+        try:
+            return self.connect()
+        except BaseException:
+            # Give the slot back to the next caller
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+            raise
+
+    def _discard(self, connection):
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+        self._safe(connection.close)
+
+    def _record_checkout(self, wait_time, waited):
+        with self._condition:
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._wait_time += wait_time
+            self._max_wait_time = max(self._max_wait_time, wait_time)
+
+    def _safe(self, func, *args):
+        """ Call func, treating any error as a False result """
+        try:
+            result = func(*args)
+        except Exception:
+            return False
+
+        return result is not False
@@ -0,0 +1,186 @@
+import base64
+import hashlib
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.crypto import constant_time_compare
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class ScryptPasswordHasher(hashers.BasePasswordHasher):
+    """ Hash passwords with scrypt, in the format used by Django 4.0+ """
+    algorithm = 'scrypt'
+    block_size = 8
+    parallelism = 1
+    dklen = 64
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    def salt(self):
+        return secrets.token_hex(16)
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(),
+            salt=salt.encode(),
+            n=n,
+            r=r,
+            p=p,
+            # Twice the 128 * n * r * p bytes needed, OpenSSL refuses to use
+            #  all of it
+            maxmem=256 * n * r * p,
+            dklen=self.dklen
+        )
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+
+        return f'{self.algorithm}${n}${salt}${r}${p}${hash_}'
+
+    def decode(self, encoded):
+        algorithm, n, salt, r, p, hash_ = encoded.split('$', 5)
+        assert algorithm == self.algorithm
+
+        return {
+            'algorithm': algorithm,
+            'work_factor': int(n),
+            'salt': salt,
+            'block_size': int(r),
+            'parallelism': int(p),
+            'hash': hash_,
+        }
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        encoded_2 = self.encode(
+            password,
+            decoded['salt'],
+            decoded['work_factor'],
+            decoded['block_size'],
+            decoded['parallelism']
+        )
+
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+
+        return {
+            'algorithm': decoded['algorithm'],
+            'work factor': decoded['work_factor'],
+            'block size': decoded['block_size'],
+            'parallelism': decoded['parallelism'],
+            'salt': hashers.mask_hash(decoded['salt']),
+            'hash': hashers.mask_hash(decoded['hash']),
+        }
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+
+        return (
+            decoded['work_factor'] != self.work_factor or
+            decoded['block_size'] != self.block_size or
+            decoded['parallelism'] != self.parallelism
+        )
+
+    def harden_runtime(self, password, encoded):
+        # The work factor is part of the hash, so there's nothing to pad
+        pass
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """ Argon2 with its costs taken from the settings (needs argon2-cffi) """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class PasswordHashBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins in progress, try again later.'
+    default_code = 'password_hash_busy'
+
+
+class PasswordHashPool:
+    """ Run password hashing in a bounded pool of threads
+
+    hashlib and argon2-cffi release the GIL while hashing, so the hashes run
+    in parallel with the other requests of the worker, while the pool caps
+    how many CPUs logins can take. Logins beyond the pool and its queue are
+    refused instead of waiting.
+
+    The calling thread still blocks until its hash is done. Under ASGI the
+    login view runs in its own threads (see user.urls) so it does not hold
+    up the thread Django runs the other sync views in.
+    """
+
+    def __init__(self, workers, queue):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='password-hash'
+        )
+        self.slots = threading.BoundedSemaphore(workers + queue)
+
+    def run(self, func, *args):
+        """ Run func in the pool and return its result """
+        if not self.slots.acquire(timeout=settings.PASSWORD_HASH_TIMEOUT):
+            raise PasswordHashBusy()
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """ Return the pool sized by the PASSWORD_HASH_* settings """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PasswordHashPool(
+                settings.PASSWORD_HASH_WORKERS,
+                settings.PASSWORD_HASH_QUEUE
+            )
+
+    return _pool
+
+
+def check_password(user, password):
+    """ Check the password of a user, rehashing it if the policy changed
+
+    Only the hashing runs in the pool, the user is saved by the caller's
+    thread so it stays in the caller's transaction.
+    """
+    pool = get_pool()
+    if not pool.run(hashers.check_password, password, user.password):
+        return False
+
+    # The same test Django uses to upgrade a hash on login
+    preferred = hashers.get_hasher('default')
+    hasher = hashers.identify_hasher(user.password)
+    if hasher.algorithm != preferred.algorithm or \
+            preferred.must_update(user.password):
+        pool.run(user.set_password, password)
+        user.save(update_fields=['password'])
+
+    return True
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import uuid
+from io import BytesIO
+
+from PIL import Image
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import bump_generation
+from core.models import Recipe, StoredImage, recipe_image_file_path
+from core.tasks import get_runner
+
+
+# Renditions generated for every recipe image:
+#  name -> (model field, maximum size, Pillow format, extension)
+RENDITIONS = {
+    'thumbnail': ('image_thumbnail', (150, 150), 'JPEG', 'jpg'),
+    'medium': ('image_medium', (600, 600), 'JPEG', 'jpg'),
+    'webp': ('image_webp', (1200, 1200), 'WEBP', 'webp'),
+}
+RENDITION_FIELDS = [field for field, *_ in RENDITIONS.values()]
+MAX_RENDITION_SIZE = (1200, 1200)
+
+
+def rendition_path(image_name, name, extension):
+    """ Return the storage path of a rendition of an image """
+    directory, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+
+    return os.path.join(directory, 'renditions', f'{stem}-{name}.{extension}')
+
+
+def render(image, size, image_format):
+    """ Return the bytes of an image resized to fit within size """
+    image = image.copy()
+    image.thumbnail(size)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, quality=85)
+
+    return buffer.getvalue()
+
+
+def generate_renditions(recipe_id, image_name):
+    """ Generate and store the renditions of a recipe image """
+    recipe = Recipe.objects.filter(id=recipe_id, image=image_name).first()
+    if recipe is None:
+        # The recipe was deleted or its image replaced since scheduling
+        return
+
+    storage = recipe.image.storage
+    paths = {}
+    with storage.open(image_name) as file:
+        image = Image.open(file)
+        # Let the JPEG decoder downscale while decoding, the renditions are
+        #  never larger than this
+        image.draft('RGB', MAX_RENDITION_SIZE)
+        image.load()
+
+        for name, (field, size, image_format, ext) in RENDITIONS.items():
+            path = rendition_path(image_name, name, ext)
+            if storage.exists(path):
+                # Content addressed images share their renditions
+                paths[field] = path
+                continue
+            paths[field] = storage.save(
+                path,
+                ContentFile(render(image, size, image_format))
+            )
+
+    # Only store the renditions if the image is still the same
+    updated = Recipe.objects.filter(id=recipe_id, image=image_name).update(
+        updated_at=timezone.now(),
+        **paths
+    )
+    if not updated:
+        # The image changed meanwhile, drop the renditions unless another
+        #  recipe shares the same content addressed image
+        if not Recipe.objects.filter(image=image_name).exists():
+            for path in paths.values():
+                storage.delete(path)
+        return
+
+    # The update skips the signals which invalidate the owner's cache
+    bump_generation(recipe.user_id)
+
+
+def schedule_renditions(recipe):
+    """ Generate the renditions of a recipe image in the background """
+    get_runner().submit(generate_renditions, recipe.id, recipe.image.name)
+
+
+def content_hash(file):
+    """ Return the SHA-256 of a file, hashed during upload if possible """
+    if getattr(file, 'content_hash', None):
+        return file.content_hash
+
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    file.seek(0)
+
+    return hasher.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """ Store files under their exact name, which identifies the content
+
+    Saving to a name which already exists keeps the stored file, with the
+    same content, instead of writing a copy under an alternate name.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+
+        # Written under a unique name then linked into place, so concurrent
+        #  writers of the same content neither clobber nor rename it
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.part', content)
+        try:
+            os.link(self.path(temporary), self.path(name))
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(self.path(temporary))
+
+        return name
+
+
+def lock_image(image_hash):
+    """ Lock a content addressed image until the transaction ends
+
+    Uploads referencing the image and releases deleting it are serialized,
+    so each sees the references committed by the other.
+    """
+    StoredImage.objects.select_for_update().get_or_create(hash=image_hash)
+
+
+def content_addressed_image(file):
+    """ Store an uploaded image by its hash, returning the recipe fields
+
+    Must run in the transaction saving the recipe, which holds the image's
+    lock until the reference is committed.
+    """
+    image_hash = content_hash(file)
+    name = recipe_image_file_path(Recipe(image_hash=image_hash), file.name)
+    lock_image(image_hash)
+    # Reuses the stored copy if there is one
+    name = ContentAddressedStorage().save(name, file)
+
+    return {'image_hash': image_hash, 'image': name}
+
+
+def release_image(image_name):
+    """ Delete an image and its renditions once no recipe references it """
+    if not image_name:
+        return
+
+    image_hash = os.path.splitext(os.path.basename(image_name))[0]
+    storage = Recipe._meta.get_field('image').storage
+    with transaction.atomic():
+        # Waits for uploads of the same image to commit their references
+        lock_image(image_hash)
+        if Recipe.objects.filter(image=image_name).exists():
+            return
+
+        storage.delete(image_name)
+        if Recipe.objects.filter(image_hash=image_hash).exists():
+            # The renditions are named after the hash only, and are still
+            #  used by the same image stored with another extension
+            return
+        for name, (_, _, _, ext) in RENDITIONS.items():
+            storage.delete(rendition_path(image_name, name, ext))
+        StoredImage.objects.filter(hash=image_hash).delete()
@@ -0,0 +1,571 @@
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from wsgiref.util import setup_testing_defaults
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from core.bulk import bulk_create
+from core.cache import bump_generation
+from core.db.backends.postgresql.base import pool_stats
+from core.images import RENDITION_FIELDS
+from core.metrics import Recorder, recorder
+from core.models import AuthToken, Tag, Ingredient, Recipe, StoredImage
+from core.search import update_search_vectors
+from core.tasks import get_runner
+
+
+SCENARIOS = ('list', 'list-cached', 'filter', 'detail', 'create',
+             'upload-image')
+# Scenarios measuring the database path rather than the response cache
+COLD_SCENARIOS = ('list', 'filter')
+# Relations of the synthetic data
+TAGS_PER_USER = 50
+INGREDIENTS_PER_USER = 200
+TAGS_PER_RECIPE = 2
+INGREDIENTS_PER_RECIPE = 5
+HOST = 'localhost'
+# Recipe fields an image upload changes, put back once the run ends
+IMAGE_FIELDS = ('image', 'image_hash', *RENDITION_FIELDS, 'updated_at')
+
+
+class Command(BaseCommand):
+    """ Django command to benchmark the recipe API on synthetic data """
+    help = 'Seed synthetic recipes and benchmark the recipe API hot paths ' \
+           'through the WSGI or ASGI handler'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--confirm-database', required=True,
+                            help='Name of the database the benchmark seeds '
+                                 'and writes to, which should be one '
+                                 'dedicated to it')
+        parser.add_argument('--recipes', type=int, default=1000,
+                            help='Recipes per synthetic user')
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--email',
+                            help='Benchmark the data of this existing user '
+                                 'instead of seeding synthetic users')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--handler', choices=('wsgi', 'asgi'),
+                            default='wsgi')
+        parser.add_argument('--scenario', choices=SCENARIOS,
+                            action='append',
+                            help='Scenario to run, all when omitted')
+        parser.add_argument('--path', action='append', default=[],
+                            help='Also benchmark GET requests of this path, '
+                                 'with an optional query string')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--output',
+                            help='File to write the results to as JSON')
+        parser.add_argument('--compare',
+                            help='Results of an earlier run to flag '
+                                 'regressions against')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Slowdown of the p50 (0.2 is 20%%) '
+                                 'reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        database = connection.settings_dict['NAME']
+        if options['confirm_database'] != database:
+            raise CommandError(
+                f'The benchmark seeds recipes into and writes to the '
+                f'{database} database, run it against a dedicated one and '
+                f'confirm it with --confirm-database {database}'
+            )
+
+        self.random = random.Random(options['seed'])
+        # Undone once the run ends, even when it fails
+        self.issued_tokens = []
+        self.replaced_images = {}
+        try:
+            self._benchmark(options)
+        finally:
+            self._clean_up()
+
+    def _benchmark(self, options):
+        if options['email']:
+            users = [self._existing_user(options['email'])]
+        else:
+            users = [
+                self._seed_user(
+                    number, options['recipes'], options['batch_size']
+                )
+                for number in range(options['users'])
+            ]
+
+        results = {
+            'meta': self._meta(options),
+            'scenarios': {},
+        }
+        scenarios = list(options['scenario'] or SCENARIOS)
+        scenarios += [f'GET {path}' for path in options['path']]
+        self.stdout.write(
+            f'{options["requests"]} requests per scenario through '
+            f'{options["handler"]}, {options["concurrency"]} at a time, '
+            f'async read views {"on" if settings.ASYNC_READ_VIEWS else "off"}'
+        )
+        media_root = tempfile.TemporaryDirectory()
+        overrides = override_settings(
+            # Benchmarks run back to back, well past the throttle budgets
+            THROTTLE_RATES={},
+            ALLOWED_HOSTS=[HOST],
+            # Queries are counted for every request by the benchmark
+            METRICS_SAMPLE_RATE=0,
+            # Runs in this one process, where any cache backend is shared
+            RECIPE_API_CACHE_TIMEOUT=settings.RECIPE_API_CACHE_TIMEOUT or 300,
+            # Uploaded images are thrown away with the directory, and the
+            #  recipes get their images back once the run ends
+            MEDIA_ROOT=media_root.name
+        )
+        try:
+            with overrides:
+                try:
+                    for name in scenarios:
+                        result = self._run(name, users, options)
+                        results['scenarios'][name] = result
+                        self._report(name, result)
+                finally:
+                    # Let background renditions finish before the media goes
+                    get_runner().drain()
+        finally:
+            media_root.cleanup()
+
+        # Connection pool wait times, when DB_POOL_SIZE is set
+        for alias, stats in pool_stats().items():
+            self.stdout.write(
+                f'pool {alias}: {stats["checkouts"]} checkouts, '
+                f'{stats["waits"]} waited (max {stats["max_wait_time"]:.3f}s),'
+                f' {stats["timeouts"]} timeouts'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        if options['compare']:
+            self._compare(results, options)
+
+    def _clean_up(self):
+        """ Delete the issued tokens and put the replaced images back """
+        AuthToken.objects.filter(key__in=self.issued_tokens).delete()
+        if not self.replaced_images:
+            return
+
+        uploaded_hashes = set(
+            Recipe.objects.filter(id__in=self.replaced_images)
+            .exclude(image_hash=None).values_list('image_hash', flat=True)
+        )
+        Recipe.objects.bulk_update(
+            [Recipe(**fields) for fields in self.replaced_images.values()],
+            IMAGE_FIELDS
+        )
+        # Hashes only the uploads referenced, when stored content addressed
+        StoredImage.objects.filter(hash__in=uploaded_hashes).exclude(
+            hash__in=Recipe.objects.filter(image_hash__in=uploaded_hashes)
+            .values('image_hash')
+        ).delete()
+        # Bulk updates skip the signals which invalidate the users' caches
+        for user_id in {fields['user_id']
+                        for fields in self.replaced_images.values()}:
+            bump_generation(user_id)
+
+    def _meta(self, options):
+        return {
+            'time': timezone.now().isoformat(),
+            'recipes_per_user': options['recipes'],
+            'users': options['users'],
+            'email': options['email'],
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'handler': options['handler'],
+            'async_read_views': settings.ASYNC_READ_VIEWS,
+            'seed': options['seed'],
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        }
+
+    def _existing_user(self, email):
+        try:
+            user = get_user_model().objects.get(email=email)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {email}')
+        if not Recipe.objects.filter(user=user).exists():
+            raise CommandError(f'{email} has no recipes to benchmark')
+
+        return self._prepare_user(
+            user,
+            list(Tag.objects.filter(user=user).values_list('id', flat=True))
+        )
+
+    def _seed_user(self, number, recipes, batch_size):
+        """ Return the synthetic user, seeding its missing recipes """
+        user, _ = get_user_model().objects.get_or_create(
+            email=f'benchmark-{number}@example.com',
+            defaults={'name': f'Benchmark {number}'}
+        )
+        tag_ids = self._seed_names(user, Tag, 'Tag', TAGS_PER_USER)
+        ingredient_ids = self._seed_names(
+            user, Ingredient, 'Ingredient', INGREDIENTS_PER_USER
+        )
+
+        existing = Recipe.objects.filter(user=user).count()
+        if existing < recipes:
+            self.stdout.write(
+                f'Seeding {recipes - existing} recipes for {user.email}'
+            )
+        start = time.monotonic()
+        for offset in range(existing, recipes, batch_size):
+            count = min(batch_size, recipes - offset)
+            with transaction.atomic():
+                self._seed_batch(user, offset, count, tag_ids, ingredient_ids)
+        if existing < recipes:
+            elapsed = time.monotonic() - start
+            rate = f'{(recipes - existing) / elapsed:.0f}' if elapsed \
+                else 'n/a'
+            self.stdout.write(
+                f'Seeded in {elapsed:.1f}s ({rate} recipes/sec)'
+            )
+            # Bulk inserts skip the signals which invalidate the user's cache
+            bump_generation(user.id)
+
+        return self._prepare_user(user, tag_ids)
+
+    def _prepare_user(self, user, tag_ids):
+        """ Attach what the scenarios' requests need to the user """
+        previous = AuthToken.objects.filter(user=user) \
+            .values_list('key', flat=True).first()
+        token = AuthToken.objects.issue(user).key
+        if token != previous:
+            # No valid credentials are left behind once the run ends
+            self.issued_tokens.append(token)
+        user.benchmark_authorization = f'Token {token}'
+        user.benchmark_tag_ids = tag_ids
+        user.benchmark_recipe_ids = list(
+            Recipe.objects.filter(user=user)
+            .values_list('id', flat=True)[:1000]
+        )
+        return user
+
+    def _seed_names(self, user, model, prefix, count):
+        """ Return the ids of the user's synthetic tags or ingredients """
+        names = [f'{prefix} {number}' for number in range(count)]
+        existing = set(
+            model.objects.filter(user=user, name__in=names)
+            .values_list('name', flat=True)
+        )
+        bulk_create(model, [
+            model(user=user, name=name)
+            for name in names if name not in existing
+        ])
+
+        return list(
+            model.objects.filter(user=user, name__in=names)
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def _seed_batch(self, user, offset, count, tag_ids, ingredient_ids):
+        recipes = bulk_create(Recipe, [
+            Recipe(
+                user=user,
+                title=f'Recipe {offset + number}',
+                time_minutes=self.random.randint(5, 180),
+                price=Decimal(self.random.randint(100, 9999)) / 100,
+            )
+            for number in range(count)
+        ])
+
+        for field, ids, per_recipe in (
+                ('tags', tag_ids, TAGS_PER_RECIPE),
+                ('ingredients', ingredient_ids, INGREDIENTS_PER_RECIPE)):
+            through = getattr(Recipe, field).through
+            target = Recipe._meta.get_field(field).m2m_reverse_name()
+            through.objects.bulk_create([
+                through(recipe_id=recipe.id, **{target: related_id})
+                for recipe in recipes
+                for related_id in self.random.sample(ids, per_recipe)
+            ])
+
+        update_search_vectors([recipe.id for recipe in recipes])
+
+    def _run(self, name, users, options):
+        """ Time a scenario, returning its statistics """
+        # Built up front so runs with the same seed make the same requests
+        requests = [
+            self._request(name, users[number % len(users)])
+            for number in range(options['requests'])
+        ]
+        if name == 'upload-image':
+            # Uploads replace the images of the recipes, kept to put back
+            self.replaced_images.update(
+                (fields['id'], fields)
+                for fields in Recipe.objects.filter(id__in={
+                    request['recipe_id'] for request in requests
+                }).exclude(id__in=self.replaced_images)
+                .values('id', 'user_id', *IMAGE_FIELDS)
+            )
+        run = {'wsgi': self._run_wsgi, 'asgi': self._run_asgi}
+        start = time.monotonic()
+        responses = run[options['handler']](
+            requests, options['concurrency'], name in COLD_SCENARIOS
+        )
+        elapsed = time.monotonic() - start
+
+        if name == 'create':
+            # Keep the data set the same from one run to the next
+            Recipe.objects.filter(id__in=[
+                json.loads(body)['id']
+                for status, _, _, body in responses if status == 201
+            ]).delete()
+
+        return self._summarize(responses, elapsed)
+
+    def _request(self, name, user):
+        """ Return the request of a scenario, as a dict """
+        request = {
+            'user': user,
+            'method': 'GET',
+            'path': reverse('recipe:recipe-list'),
+            'query': '',
+            'body': b'',
+            'content_type': '',
+        }
+        if name.startswith('GET '):
+            path, _, query = name[len('GET '):].partition('?')
+            request.update(path=path, query=query)
+        elif name == 'filter':
+            tags = self.random.sample(
+                user.benchmark_tag_ids, min(2, len(user.benchmark_tag_ids))
+            )
+            request['query'] = \
+                f'tags={",".join(str(tag) for tag in tags)}&' \
+                f'match={self.random.choice(("any", "all"))}'
+        elif name == 'detail':
+            request['path'] = reverse(
+                'recipe:recipe-detail',
+                args=[self.random.choice(user.benchmark_recipe_ids)]
+            )
+        elif name == 'create':
+            request.update(
+                method='POST',
+                body=json.dumps({
+                    'title': 'Benchmark recipe',
+                    'time_minutes': 10,
+                    'price': '5.00',
+                    'tags': user.benchmark_tag_ids[:TAGS_PER_RECIPE],
+                    'ingredients': [],
+                }).encode(),
+                content_type='application/json'
+            )
+        elif name == 'upload-image':
+            recipe_id = self.random.choice(user.benchmark_recipe_ids)
+            request.update(
+                method='POST',
+                path=reverse('recipe:recipe-upload-image', args=[recipe_id]),
+                recipe_id=recipe_id,
+                body=encode_multipart(BOUNDARY, {'image': self._image()}),
+                content_type=MULTIPART_CONTENT
+            )
+
+        return request
+
+    def _image(self):
+        if not hasattr(self, '_image_bytes'):
+            buffer = io.BytesIO()
+            Image.new('RGB', (800, 600), 'orange').save(buffer, 'JPEG')
+            self._image_bytes = buffer.getvalue()
+
+        image = io.BytesIO(self._image_bytes)
+        image.name = 'benchmark.jpg'
+        return image
+
+    def _run_wsgi(self, requests, concurrency, cold):
+        """ Call the WSGI handler from a pool of threads, as gthread does """
+        handler = WSGIHandler()
+
+        def call(request):
+            environ = {
+                'REQUEST_METHOD': request['method'],
+                'PATH_INFO': request['path'],
+                'QUERY_STRING': request['query'],
+                'CONTENT_TYPE': request['content_type'],
+                'CONTENT_LENGTH': str(len(request['body'])),
+                'HTTP_HOST': HOST,
+                'HTTP_AUTHORIZATION': request['user'].benchmark_authorization,
+                'wsgi.input': io.BytesIO(request['body']),
+            }
+            setup_testing_defaults(environ)
+            response = handler(environ, lambda status, headers: None)
+            body = b''.join(response)
+            response.close()
+            return response.status_code, body
+
+        def timed(request):
+            if cold:
+                # Measure the database path, not the response cache
+                bump_generation(request['user'].id)
+            current = Recorder()
+            token = recorder.set(current)
+            try:
+                start = time.perf_counter()
+                status, body = call(request)
+                latency = time.perf_counter() - start
+            finally:
+                recorder.reset(token)
+            return status, latency, current.queries, body
+
+        if concurrency == 1:
+            # In this thread, on the command's own database connection
+            return [timed(request) for request in requests]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(timed, requests))
+
+    def _run_asgi(self, requests, concurrency, cold):
+        """ Call the ASGI handler from concurrent tasks on one event loop """
+        handler = ASGIHandler()
+
+        async def call(request):
+            scope = {
+                'type': 'http',
+                'method': request['method'],
+                'path': request['path'],
+                'query_string': request['query'].encode(),
+                'headers': [
+                    (b'host', HOST.encode()),
+                    (b'authorization',
+                     request['user'].benchmark_authorization.encode()),
+                    (b'content-type', request['content_type'].encode()),
+                    (b'content-length', str(len(request['body'])).encode()),
+                ],
+            }
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': request['body']}
+
+            async def send(message):
+                messages.append(message)
+
+            await handler(scope, receive, send)
+            return messages[0]['status'], b''.join(
+                message.get('body', b'') for message in messages[1:]
+            )
+
+        async def timed(request, slots):
+            async with slots:
+                if cold:
+                    await sync_to_async(bump_generation)(request['user'].id)
+                # Set in this task's own context, which the handler's threads
+                #  copy
+                current = Recorder()
+                token = recorder.set(current)
+                try:
+                    start = time.perf_counter()
+                    status, body = await call(request)
+                    latency = time.perf_counter() - start
+                finally:
+                    recorder.reset(token)
+                return status, latency, current.queries, body
+
+        async def run():
+            slots = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(
+                *(timed(request, slots) for request in requests)
+            )
+
+        return list(asyncio.run(run()))
+
+    def _summarize(self, responses, elapsed):
+        """ Return the statistics of a scenario's responses """
+        latencies = sorted(latency for _, latency, _, _ in responses)
+        queries = [count for _, _, count, _ in responses]
+        statuses = Counter(status for status, _, _, _ in responses)
+
+        return {
+            'requests': len(responses),
+            'throughput': len(responses) / elapsed if elapsed else None,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p99_ms': latencies[
+                min(len(latencies) - 1, int(len(latencies) * 0.99))
+            ] * 1000,
+            'mean_queries': statistics.mean(queries),
+            'max_queries': max(queries),
+            'statuses': {str(status): count
+                         for status, count in sorted(statuses.items())},
+        }
+
+    def _report(self, name, result):
+        throughput = f'{result["throughput"]:.0f}' \
+            if result['throughput'] is not None else 'n/a'
+        self.stdout.write(
+            f'{name}: {throughput} requests/sec, '
+            f'p50 {result["p50_ms"]:.1f}ms, p99 {result["p99_ms"]:.1f}ms, '
+            f'{result["mean_queries"]:.1f} queries, '
+            f'statuses {result["statuses"]}'
+        )
+
+    def _compare(self, results, options):
+        """ Report the scenarios slower or making more queries than before """
+        if not os.path.exists(options['compare']):
+            raise CommandError(f'No results at {options["compare"]}')
+        with open(options['compare']) as file:
+            baseline = json.load(file)
+
+        before_meta = baseline.get('meta', {})
+        for key in ('handler', 'concurrency'):
+            if key in before_meta and before_meta[key] != options[key]:
+                self.stdout.write(self.style.WARNING(
+                    f'Compared run used {key} {before_meta[key]}, this run '
+                    f'{options[key]}'
+                ))
+
+        regressions = []
+        for name, result in results['scenarios'].items():
+            before = baseline['scenarios'].get(name)
+            if before is None:
+                continue
+            slowdown = result['p50_ms'] / before['p50_ms'] - 1
+            if slowdown > options['threshold']:
+                regressions.append(
+                    f'{name}: p50 {before["p50_ms"]:.1f}ms -> '
+                    f'{result["p50_ms"]:.1f}ms (+{slowdown:.0%})'
+                )
+            if result['max_queries'] > before['max_queries']:
+                regressions.append(
+                    f'{name}: queries {before["max_queries"]} -> '
+                    f'{result["max_queries"]}'
+                )
+
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions'))
+            return
+        for regression in regressions:
+            self.stdout.write(self.style.WARNING(f'Regression {regression}'))
+        if options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regressions')
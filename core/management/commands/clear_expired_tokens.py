@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    """ Django command to delete expired API tokens """
+    help = 'Delete expired API tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Tokens deleted per query, so the table is '
+                                 'never locked for long')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = AuthToken.objects.filter(expires_at__lte=now) \
+            .order_by('expires_at')
+        deleted = 0
+        while True:
+            keys = list(
+                expired.values_list('key', flat=True)[:options['batch_size']]
+            )
+            if not keys:
+                break
+            # Each batch is its own statement, committed on its own
+            count, _ = AuthToken.objects.filter(key__in=keys).delete()
+            deleted += count
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired tokens'
+        ))
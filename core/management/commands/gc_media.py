@@ -0,0 +1,163 @@
+import os
+import string
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from core.images import RENDITION_FIELDS
+from core.models import Recipe, recipe_image_file_path
+
+# Files are sharded by the first character of their name, so a sweep can be
+#  limited to some shards and resumed. Generated names are hex (uuid4 or
+#  SHA-256), anything else goes to 'other'
+SHARDS = tuple(string.hexdigits[:16]) + ('other',)
+IMAGE_FIELDS = ('image', *RENDITION_FIELDS)
+
+
+def shard_of(filename):
+    """ Return the shard a file name belongs to """
+    first = filename[:1].lower()
+    return first if first in SHARDS else 'other'
+
+
+class Command(BaseCommand):
+    """ Django command to remove recipe images no recipe references """
+    help = 'Delete (or report) orphaned recipe images and renditions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report orphans without deleting them')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Seconds a file must be untouched before it '
+                                 'is considered, so files of uploads still '
+                                 'in flight are kept')
+        parser.add_argument('--max-shards', type=int,
+                            help='Stop after sweeping this many shards')
+        parser.add_argument('--checkpoint',
+                            help='File recording the last swept shard to '
+                                 'resume from on the next run')
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        upload_dir = os.path.dirname(recipe_image_file_path(Recipe(), 'x'))
+        try:
+            root = storage.path(upload_dir)
+        except NotImplementedError:
+            raise CommandError('Only local file storage can be swept')
+
+        checkpoint = options['checkpoint']
+        last = self._read_checkpoint(checkpoint)
+        shards = SHARDS[SHARDS.index(last) + 1:] if last else SHARDS
+        if options['max_shards'] is not None:
+            shards = shards[:options['max_shards']]
+        if last:
+            self.stdout.write(f'Resuming after shard {last}')
+
+        cutoff = time.time() - options['min_age']
+        start = time.monotonic()
+        scanned = orphans = 0
+        for directory, prefix in (
+                (root, upload_dir),
+                (os.path.join(root, 'renditions'),
+                 os.path.join(upload_dir, 'renditions'))):
+            swept = self._sweep(directory, prefix, shards, cutoff, options)
+            scanned += swept[0]
+            orphans += swept[1]
+
+        # The shards are only complete once both directories are listed
+        if shards:
+            self._write_checkpoint(
+                checkpoint, None if shards[-1] == SHARDS[-1] else shards[-1]
+            )
+
+        verb = 'Found' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {orphans} orphaned files out of {scanned} scanned in '
+            f'{time.monotonic() - start:.1f}s'
+        ))
+
+    def _sweep(self, directory, prefix, shards, cutoff, options):
+        """ Sweep the files of the shards, returning (scanned, orphans)
+
+        The directory is listed once, each shard filling a batch which is
+        checked as soon as it holds --batch-size files, so at most a batch
+        per shard is in memory.
+        """
+        if not os.path.isdir(directory):
+            return 0, 0
+
+        batches = {shard: {} for shard in shards}
+        scanned = orphans = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                batch = batches.get(shard_of(entry.name))
+                if batch is None or not entry.is_file():
+                    continue
+                if entry.stat().st_mtime > cutoff:
+                    continue
+                # Names as stored in the image fields, under the prefix
+                batch[os.path.join(prefix, entry.name)] = entry.path
+                if len(batch) >= options['batch_size']:
+                    scanned += len(batch)
+                    orphans += self._sweep_batch(batch, options['dry_run'])
+                    batch.clear()
+
+        for batch in batches.values():
+            if batch:
+                scanned += len(batch)
+                orphans += self._sweep_batch(batch, options['dry_run'])
+
+        return scanned, orphans
+
+    def _sweep_batch(self, batch, dry_run):
+        """ Report and delete the orphans of a batch, returning their count """
+        verb = 'Found' if dry_run else 'Deleted'
+        orphans = self._orphans(batch)
+        for name in orphans:
+            self.stdout.write(f'{verb} {name}')
+            if not dry_run:
+                self._remove(batch[name])
+
+        return len(orphans)
+
+    def _orphans(self, batch):
+        """ Return the names of the batch no recipe references """
+        names = list(batch)
+        condition = Q()
+        for field in IMAGE_FIELDS:
+            condition |= Q(**{f'{field}__in': names})
+
+        referenced = set()
+        for row in Recipe.objects.filter(condition) \
+                .values_list(*IMAGE_FIELDS):
+            referenced.update(row)
+
+        return [name for name in names if name not in referenced]
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Removed since it was scanned, which is what we wanted anyway
+            pass
+
+    def _read_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return file.read().strip() or None
+
+    def _write_checkpoint(self, path, shard):
+        if not path:
+            return
+        if shard is None:
+            # The sweep is complete, the next one starts from the beginning
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        # Replace the file so an interruption never leaves it half written
+        with open(f'{path}.tmp', 'w') as file:
+            file.write(shard)
+        os.replace(f'{path}.tmp', path)
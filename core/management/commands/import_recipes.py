@@ -0,0 +1,162 @@
+import csv
+import json
+import os
+import time
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.bulk import bulk_create
+from core.cache import bump_generation
+from core.models import Tag, Ingredient, Recipe
+from core.search import update_search_vectors
+from recipe.export import CSV_LIST_SEPARATOR
+
+
+class Command(BaseCommand):
+    """ Django command to stream recipes from an NDJSON or CSV export """
+    help = 'Import recipes for a user from an NDJSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--email', required=True,
+                            help='Email of the user owning the recipes')
+        parser.add_argument('--format', choices=('ndjson', 'csv'),
+                            help='File format, guessed from the extension '
+                                 'when omitted')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint',
+                            help='File recording the imported record count '
+                                 'to resume an interrupted import from')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["email"]}')
+
+        file_format = options['format'] or (
+            'csv' if options['path'].endswith('.csv') else 'ndjson'
+        )
+        checkpoint = options['checkpoint']
+        done = self._read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Resuming after {done} records')
+
+        # Name -> id maps, so names are only looked up once per import
+        related_ids = {
+            Tag: dict(
+                Tag.objects.filter(user=user).values_list('name', 'id')
+            ),
+            Ingredient: dict(
+                Ingredient.objects.filter(user=user).values_list('name', 'id')
+            ),
+        }
+
+        start = time.monotonic()
+        imported = 0
+        with open(options['path'], newline='') as file:
+            records = islice(self._read(file, file_format), done, None)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+
+                # A batch is either imported and checkpointed, or not at all
+                with transaction.atomic():
+                    self._import_batch(user, batch, related_ids)
+                imported += len(batch)
+                self._write_checkpoint(checkpoint, done + imported)
+
+                elapsed = time.monotonic() - start
+                # Coarse clocks may not have advanced over a small batch
+                rate = f'{imported / elapsed:.0f}' if elapsed else 'n/a'
+                self.stdout.write(
+                    f'Imported {done + imported} records '
+                    f'({rate} records/sec)'
+                )
+
+        # Bulk inserts skip the signals which invalidate the user's cache
+        bump_generation(user.id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes in {time.monotonic() - start:.1f}s'
+        ))
+
+    def _read(self, file, file_format):
+        """ Yield the records of the file one at a time """
+        if file_format == 'csv':
+            for record in csv.DictReader(file):
+                for field in ('tags', 'ingredients'):
+                    names = record.get(field) or ''
+                    record[field] = [
+                        name for name in names.split(CSV_LIST_SEPARATOR)
+                        if name
+                    ]
+                yield record
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+    def _create_missing(self, user, model, names, ids):
+        """ Create the objects missing from the name -> id map """
+        missing = [name for name in dict.fromkeys(names) if name not in ids]
+        if missing:
+            created = bulk_create(
+                model,
+                [model(user=user, name=name) for name in missing]
+            )
+            ids.update((obj.name, obj.id) for obj in created)
+
+    def _import_batch(self, user, batch, related_ids):
+        """ Insert a batch of recipes and their relations """
+        try:
+            recipes = bulk_create(Recipe, [
+                Recipe(
+                    user=user,
+                    title=record['title'],
+                    time_minutes=int(record['time_minutes']),
+                    price=Decimal(str(record['price'])),
+                    link=record.get('link') or '',
+                )
+                for record in batch
+            ])
+        except (KeyError, ValueError, ArithmeticError) as error:
+            raise CommandError(f'Invalid record: {error!r}')
+
+        for model, field in ((Tag, 'tags'), (Ingredient, 'ingredients')):
+            ids = related_ids[model]
+            names = [
+                name for record in batch for name in record.get(field, ())
+            ]
+            self._create_missing(user, model, names, ids)
+
+            through = getattr(Recipe, field).through
+            target = Recipe._meta.get_field(field).m2m_reverse_name()
+            through.objects.bulk_create([
+                through(recipe_id=recipe.id, **{target: related_id})
+                for recipe, record in zip(recipes, batch)
+                for related_id in dict.fromkeys(
+                    ids[name] for name in record.get(field, ())
+                )
+            ])
+
+        # Bulk inserts skip the signals which maintain the search vectors
+        update_search_vectors([recipe.id for recipe in recipes])
+
+    def _read_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as file:
+            return int(file.read().strip() or 0)
+
+    def _write_checkpoint(self, path, count):
+        if not path:
+            return
+        # Replace the file so an interruption never leaves it half written
+        with open(f'{path}.tmp', 'w') as file:
+            file.write(str(count))
+        os.replace(f'{path}.tmp', path)
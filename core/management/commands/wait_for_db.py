@@ -1,23 +1,77 @@
+import random
 import time
 
 from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
     """ Django command to pause exectuion util database is available """
+    help = 'Wait until the database accepts queries, with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Seconds to give up after')
+        parser.add_argument('--initial-delay', type=float, default=0.5)
+        parser.add_argument('--max-delay', type=float, default=10)
+        parser.add_argument('--check-migrations', action='store_true',
+                            help='Also wait until no migration is pending')
+
     def handle(self, *args, **options):
         self.stdout.write('Waiting for database..')
-        db_conn = None
-        while not db_conn:
-            try:
-                # try to set db_conn to that active connection
-                db_conn = connections['default']
-            except OperationalError:
-                # notify user of waiting and wait
-                self.stdout.write('Database unavailable, waiting 1 second')
-                # Won't take time during tests because it is being mocked
-                time.sleep(1)
-
-        self.stdout.write(self.style.SUCCESS('Database available!'))
+        connection = connections[options['database']]
+        start = time.monotonic()
+        deadline = start + options['timeout']
+        delay = options['initial_delay']
+        attempts = 0
+        while True:
+            attempts += 1
+            problem = self._probe(connection, options['check_migrations'])
+            if problem is None:
+                break
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CommandError(
+                    f'{problem}, giving up after {attempts} attempts'
+                )
+            # Full jitter, so containers starting together spread their
+            #  retries instead of hitting the database in waves
+            wait = min(random.uniform(0, delay), remaining)
+            self.stdout.write(f'{problem}, waiting {wait:.1f} seconds')
+            # Won't take time during tests because it is being mocked
+            time.sleep(wait)
+            delay = min(delay * 2, options['max_delay'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Database available! Ready after {attempts} attempts in '
+            f'{time.monotonic() - start:.2f}s'
+        ))
+
+    def _probe(self, connection, check_migrations):
+        """ Return why the database is not ready, or None """
+        try:
+            # Opens the connection (ensure_connection) and runs a query, in
+            #  case it accepts connections before it can serve queries
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+            if check_migrations:
+                executor = MigrationExecutor(connection)
+                plan = executor.migration_plan(
+                    executor.loader.graph.leaf_nodes()
+                )
+                if plan:
+                    return f'{len(plan)} migrations pending'
+        except OperationalError as error:
+            # Reconnect from scratch on the next attempt. Within an atomic
+            #  block (eg. under tests) Django would only mark it closed, and
+            #  never reconnect
+            if not connection.in_atomic_block:
+                connection.close()
+            return f'Database unavailable ({str(error).strip()})'
+
+        return None
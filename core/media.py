@@ -0,0 +1,131 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, \
+                        HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+
+# Uploaded files get unique names (see recipe_image_file_path) and are never
+#  modified in place, so clients and proxies may cache them indefinitely
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """ A file which only reads up to the end of a byte range
+
+    It has no fileno() on purpose, a file wrapper could otherwise sendfile()
+    the descriptor directly and ignore the range.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _parse_range(header, size):
+    """ Return the (start, end) of a single byte range, None to ignore it """
+    match = RANGE_RE.match(header)
+    if not match or match.groups() == ('', ''):
+        # Multiple or malformed ranges are answered with the whole file
+        return None
+
+    start, end = match.groups()
+    if not start:
+        # bytes=-N is the last N bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end or size - 1), size - 1)
+    if start > end and start < size:
+        return None
+
+    return start, end
+
+
+def serve_media(request, path):
+    """ Serve an uploaded media file
+
+    Depending on MEDIA_SERVE_MODE the file is handed to the web server with
+    X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd), or sent by the
+    WSGI server which uses sendfile for whole files when it supports
+    wsgi.file_wrapper.
+    """
+    try:
+        full_path = safe_join(os.path.abspath(settings.MEDIA_ROOT), path)
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError, ValueError):
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    content_type = mimetypes.guess_type(full_path)[0] or \
+        'application/octet-stream'
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = \
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+    elif mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        response = _file_response(request, full_path, stat, content_type)
+        if response.status_code == 304:
+            return response
+
+    response['Cache-Control'] = CACHE_CONTROL
+    response['Last-Modified'] = http_date(stat.st_mtime)
+
+    return response
+
+
+def _file_response(request, full_path, stat, content_type):
+    """ Return the file, or the byte range requested, from Python """
+    if not was_modified_since(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'),
+        stat.st_mtime,
+        stat.st_size
+    ):
+        response = HttpResponseNotModified()
+        response['Cache-Control'] = CACHE_CONTROL
+        return response
+
+    size = stat.st_size
+    byte_range = _parse_range(request.META.get('HTTP_RANGE', ''), size)
+    if byte_range and byte_range[0] >= size:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(full_path, 'rb')
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(
+            RangeFile(file, start, end - start + 1),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,164 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+SECONDS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': (
+        'Time to respond to the request', SECONDS_BUCKETS
+    ),
+    'http_request_db_queries': (
+        'SQL queries run for the request', QUERIES_BUCKETS
+    ),
+    'http_request_db_duration_seconds': (
+        'Time spent running the SQL queries of the request', SECONDS_BUCKETS
+    ),
+    'http_request_serializer_duration_seconds': (
+        'Time spent serializing the response data', SECONDS_BUCKETS
+    ),
+}
+
+
+class Histogram:
+    """ Cumulative histogram in the Prometheus sense """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One count per bucket, the last one for +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """ Thread safe histograms by name and labels """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = \
+                    Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """ Return the histograms in the Prometheus text format """
+        lines = []
+        with self._lock:
+            for name, (help_text, _) in HISTOGRAMS.items():
+                series = [
+                    (labels, histogram)
+                    for (series_name, labels), histogram
+                    in sorted(self._histograms.items())
+                    if series_name == name
+                ]
+                if not series:
+                    continue
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in series:
+                    lines.extend(_histogram_lines(name, labels, histogram))
+
+        return lines
+
+
+def _format_labels(labels):
+    return ','.join(
+        f'{name}="{_escape(str(value))}"' for name, value in labels
+    )
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _histogram_lines(name, labels, histogram):
+    cumulative = 0
+    bounds = [str(bound) for bound in histogram.buckets] + ['+Inf']
+    for bound, count in zip(bounds, histogram.counts):
+        cumulative += count
+        bucket_labels = _format_labels(labels + (('le', bound),))
+        yield f'{name}_bucket{{{bucket_labels}}} {cumulative}'
+    yield f'{name}_sum{{{_format_labels(labels)}}} {histogram.sum}'
+    yield f'{name}_count{{{_format_labels(labels)}}} {histogram.count}'
+
+
+registry = Registry()
+
+
+class Recorder:
+    """ What a sampled request spent its time on """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        # Nested serializations are part of the outermost one
+        self.serializer_depth = 0
+
+
+# Recorder of the current request, None when it is not sampled
+recorder = ContextVar('metrics_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """ Database execute wrapper counting and timing the queries """
+    current = recorder.get()
+    if current is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current.db_time += time.perf_counter() - start
+        current.queries += 1
+
+
+@contextmanager
+def timed_serialization():
+    """ Add the time spent in the block to the request's serializer time """
+    current = recorder.get()
+    if current is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    current.serializer_depth += 1
+    try:
+        yield
+    finally:
+        current.serializer_depth -= 1
+        if not current.serializer_depth:
+            current.serializer_time += time.perf_counter() - start
+
+
+class TimedSerializerMixin:
+    """ Record the time spent building the serializer's data """
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
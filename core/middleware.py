@@ -0,0 +1,77 @@
+import asyncio
+import random
+import time
+
+from django.conf import settings
+
+from core.metrics import Recorder, recorder, registry
+
+
+class MetricsMiddleware:
+    """ Record the latency, queries and serializer time of sampled requests
+
+    METRICS_SAMPLE_RATE is the share of requests recorded, requests which
+    are not sampled only cost the sampling decision.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Lets the ASGI handler call the middleware without a thread
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self._acall(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        current, token, start = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            recorder.reset(token)
+        self._finish(request, response, current, start)
+
+        return response
+
+    async def _acall(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        current, token, start = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            recorder.reset(token)
+        self._finish(request, response, current, start)
+
+        return response
+
+    def _sampled(self):
+        rate = settings.METRICS_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def _start(self):
+        current = Recorder()
+        return current, recorder.set(current), time.perf_counter()
+
+    def _finish(self, request, response, current, start):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        labels = {
+            'route': match.view_name if match else 'unmatched',
+            'method': request.method,
+        }
+        registry.observe('http_request_duration_seconds', labels, duration)
+        registry.observe('http_request_db_queries', labels, current.queries)
+        registry.observe(
+            'http_request_db_duration_seconds', labels, current.db_time
+        )
+        registry.observe(
+            'http_request_serializer_duration_seconds',
+            labels,
+            current.serializer_time
+        )
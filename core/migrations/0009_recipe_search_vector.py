@@ -0,0 +1,45 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+POPULATE_SEARCH_VECTORS = (
+    "UPDATE core_recipe SET search_vector = "
+    "setweight(to_tsvector('english', title), 'A') || "
+    "setweight(to_tsvector('english', coalesce(("
+    "SELECT string_agg(t.name, ' ') FROM core_tag t "
+    "JOIN core_recipe_tags rt ON rt.tag_id = t.id "
+    "WHERE rt.recipe_id = core_recipe.id), '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(("
+    "SELECT string_agg(i.name, ' ') FROM core_ingredient i "
+    "JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id "
+    "WHERE ri.recipe_id = core_recipe.id), '')), 'B')"
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_updated_at'),
+    ]
+
+    operations = [
+        # Needed by the title trigram index
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_recipe_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='core_recipe_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        # Build the search vectors of the existing recipes
+        migrations.RunSQL(POPULATE_SEARCH_VECTORS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_medium',
+            field=models.ImageField(editable=False, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(editable=False, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_webp',
+            field=models.ImageField(editable=False, null=True, upload_to=''),
+        ),
+    ]
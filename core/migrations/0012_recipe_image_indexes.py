@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:37
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_image_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, null=True, upload_to=core.models.recipe_image_file_path),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_medium',
+            field=models.ImageField(db_index=True, editable=False, null=True, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(db_index=True, editable=False, null=True, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_webp',
+            field=models.ImageField(db_index=True, editable=False, null=True, upload_to=''),
+        ),
+    ]
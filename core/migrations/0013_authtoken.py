@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:41
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def move_tokens(apps, schema_editor):
+    """ Move the never expiring tokens over, starting their lifetime now """
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('core', 'AuthToken')
+    expires_at = timezone.now() + timedelta(
+        seconds=settings.TOKEN_EXPIRE_AFTER
+    )
+    AuthToken.objects.bulk_create(
+        AuthToken(key=token.key, user_id=token.user_id, expires_at=expires_at)
+        for token in Token.objects.iterator()
+    )
+    Token.objects.all().delete()
+
+
+def move_tokens_back(apps, schema_editor):
+    """ Move the valid tokens back, they never expire again """
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('core', 'AuthToken')
+    Token.objects.bulk_create(
+        Token(key=token.key, user_id=token.user_id)
+        for token in AuthToken.objects.filter(
+            expires_at__gt=timezone.now()
+        ).iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_recipe_image_indexes'),
+        ('authtoken', '0003_tokenproxy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='api_token', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(move_tokens, move_tokens_back),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_authtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+            ],
+        ),
+    ]
@@ -1,6 +1,12 @@
 import uuid
 import os
-from django.db import models
+import secrets
+from datetime import timedelta
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 # imports user database managers
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
@@ -12,7 +18,11 @@ from django.conf import settings
 def recipe_image_file_path(instance, filename):
     """ Generate file path for new recipe image """
     ext = filename.split('.')[-1]
-    filename = f'{uuid.uuid4()}.{ext}'
+    if settings.RECIPE_IMAGE_CONTENT_ADDRESSED:
+        # Named after the content so identical images are only stored once
+        filename = f'{instance.image_hash}.{ext}'
+    else:
+        filename = f'{uuid.uuid4()}.{ext}'
 
     return os.path.join('uploads/recipe/', filename)
 
@@ -57,6 +67,59 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
+class AuthTokenManager(models.Manager):
+
+    def issue(self, user, rotate=False):
+        """ Return the user's valid token, replacing it when expired """
+        with transaction.atomic():
+            token = self.select_for_update().filter(user=user).first()
+            if token is not None and not rotate and not token.is_expired():
+                return token
+            if token is not None:
+                # Deleted rather than updated, so the old key is evicted
+                token.delete()
+
+            try:
+                with transaction.atomic():
+                    return self.create(
+                        user=user,
+                        expires_at=timezone.now() + timedelta(
+                            seconds=settings.TOKEN_EXPIRE_AFTER
+                        )
+                    )
+            except IntegrityError:
+                # A first token has no row to lock, a concurrent login
+                #  created it meanwhile
+                return self.get(user=user)
+
+
+class AuthToken(models.Model):
+    """ Expiring API token, one per user """
+    key = models.CharField(max_length=40, primary_key=True)
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        related_name='api_token',
+        on_delete=models.CASCADE
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    # Indexed for clear_expired_tokens, and read with the token so expiry
+    #  is checked without another query
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = AuthTokenManager()
+
+    def save(self, *args, **kwargs):
+        if not self.key:
+            self.key = secrets.token_hex(20)
+        return super().save(*args, **kwargs)
+
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+    def __str__(self):
+        return self.key
+
+
 class Tag(models.Model):
     """ Tag to be used for a recipe """
     name = models.CharField(max_length=255)
@@ -64,6 +127,13 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Lists are filtered by user and ordered by name
+        indexes = [
+            models.Index(fields=['user', 'name']),
+        ]
 
     def __str__(self):
         return self.name
@@ -76,6 +146,13 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Lists are filtered by user and ordered by name
+        indexes = [
+            models.Index(fields=['user', 'name']),
+        ]
 
     def __str__(self):
         return self.name
@@ -101,7 +178,53 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     # Passing a reference to the function so it can be called each time image
     #  is uploaded
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # The image columns are indexed to look up which files are referenced
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        db_index=True
+    )
+    # SHA-256 of the image, set when images are stored content addressed
+    image_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False
+    )
+    # Smaller renditions of the image, generated in the background by
+    #  core.images after an upload
+    image_thumbnail = models.ImageField(
+        null=True,
+        editable=False,
+        db_index=True
+    )
+    image_medium = models.ImageField(null=True, editable=False, db_index=True)
+    image_webp = models.ImageField(null=True, editable=False, db_index=True)
+    # Also bumped when the tags or ingredients of the recipe change, used to
+    #  answer conditional requests
+    updated_at = models.DateTimeField(auto_now=True)
+    # Title, tag and ingredient names, maintained by core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        # Conditional list requests aggregate updated_at per user
+        indexes = [
+            models.Index(fields=['user', 'updated_at']),
+            GinIndex(fields=['search_vector'], name='core_recipe_search_idx'),
+            GinIndex(
+                fields=['title'],
+                name='core_recipe_title_trgm_idx',
+                opclasses=['gin_trgm_ops']
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class StoredImage(models.Model):
+    """ A content addressed recipe image, locked while references change """
+    hash = models.CharField(max_length=64, primary_key=True)
+
+    def __str__(self):
+        return self.hash
@@ -0,0 +1,66 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Replica the reads of the current request go to, set by ReplicaReadMixin
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def _sticky_key(user_id):
+    return f'replica:sticky:{user_id}'
+
+
+def stick_to_primary(user_id):
+    """ Read from the primary for the user's next requests
+
+    Called on writes, so the user reads them back even before the replicas
+    caught up.
+    """
+    caches[settings.REPLICA_CACHE_ALIAS].set(
+        _sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS
+    )
+
+
+def is_stuck_to_primary(user_id):
+    """ Return whether the user wrote recently """
+    return caches[settings.REPLICA_CACHE_ALIAS].get(
+        _sticky_key(user_id), False
+    )
+
+
+@contextmanager
+def read_from_replica():
+    """ Send the reads made inside the block to a replica, if any """
+    alias = random.choice(settings.DATABASE_REPLICAS) \
+        if settings.DATABASE_REPLICAS else None
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """ Read from a replica inside read_from_replica, otherwise the primary
+
+    Writes always go to the primary, and the replicas only mirror it so
+    migrations only run there.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data, objects read from any can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,49 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, \
+                                           SearchVector, TrigramSimilarity
+from django.db.models import OuterRef, Subquery
+
+from core.models import Tag, Ingredient, Recipe
+
+
+# Text search configuration used to build and query the search vectors
+SEARCH_CONFIG = 'english'
+# Minimum title similarity for a trigram match
+TRIGRAM_THRESHOLD = 0.3
+
+
+def _names(model):
+    """ Return a subquery of the space separated names for each recipe """
+    return Subquery(
+        model.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('name', ' ')
+        ).values('names')
+    )
+
+
+def update_search_vectors(recipe_ids):
+    """ Recompute the stored search vector of the recipes """
+    # The title weighs more than the tag and ingredient names
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        search_vector=(
+            SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+            SearchVector(_names(Tag), weight='B', config=SEARCH_CONFIG) +
+            SearchVector(_names(Ingredient), weight='B', config=SEARCH_CONFIG)
+        )
+    )
+
+
+def search_recipes(queryset, terms, mode='fulltext'):
+    """ Filter recipes matching the terms, annotated with their rank """
+    if mode == 'trigram':
+        # Tolerates typos but only compares against the title
+        return queryset.annotate(
+            rank=TrigramSimilarity('title', terms)
+        ).filter(rank__gte=TRIGRAM_THRESHOLD)
+
+    query = SearchQuery(terms, search_type='websearch', config=SEARCH_CONFIG)
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank('search_vector', query)
+    )
@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, pre_delete, post_delete, \
+                                     m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.authentication import token_cache
+from core.cache import bump_generation
+from core.images import release_image
+from core.metrics import record_query
+from core.models import Tag, Ingredient, Recipe, AuthToken
+from core.search import update_search_vectors
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """ Invalidate the cached responses of the object's owner """
+    bump_generation(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_user_cache_m2m(sender, instance, action, **kwargs):
+    """ Invalidate the cached responses when recipe relations change """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_generation(instance.user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_new_user_cache(sender, instance, created, **kwargs):
+    """ Make sure a new user never sees responses cached for a reused id """
+    if created:
+        bump_generation(instance.id)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    """ Rebuild the search vector of a saved recipe """
+    update_search_vectors([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipes_m2m(sender, instance, action, reverse, model, pk_set,
+                      **kwargs):
+    """ Update the recipes whose tags or ingredients changed """
+    if not reverse:
+        # recipe.tags.add(...), the instance is the recipe
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _recipes_changed([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        # tag.recipe_set.add(...), the changed ids are the recipes
+        _recipes_changed(pk_set)
+    elif action == 'pre_clear':
+        # The recipes are only known before the relations are cleared
+        instance._changed_recipe_ids = _related_recipe_ids(instance)
+    elif action == 'post_clear':
+        _recipes_changed(instance.__dict__.pop('_changed_recipe_ids', []))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_recipes(sender, instance, created, **kwargs):
+    """ Update the recipes nesting a changed tag or ingredient """
+    if not created:
+        _recipes_changed(_related_recipe_ids(instance))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def collect_deleted_recipes(sender, instance, **kwargs):
+    """ Remember the recipes nesting a tag or ingredient being deleted """
+    instance._changed_recipe_ids = _related_recipe_ids(instance)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def touch_deleted_recipes(sender, instance, **kwargs):
+    """ Update the recipes which nested a deleted tag or ingredient """
+    _recipes_changed(instance.__dict__.pop('_changed_recipe_ids', []))
+
+
+def _related_recipe_ids(instance):
+    """ Return the ids of the recipes assigned a tag or ingredient """
+    field = 'tags' if isinstance(instance, Tag) else 'ingredients'
+    return list(
+        Recipe.objects.filter(**{field: instance}).values_list('pk', flat=True)
+    )
+
+
+def _recipes_changed(recipe_ids):
+    """ Bump updated_at and rebuild the search vectors of recipes """
+    if not recipe_ids:
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update(updated_at=timezone.now())
+    update_search_vectors(recipe_ids)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    """ Delete a content addressed image with the last recipe using it """
+    if settings.RECIPE_IMAGE_CONTENT_ADDRESSED and instance.image:
+        name = instance.image.name
+        transaction.on_commit(lambda: release_image(name))
+
+
+@receiver(post_delete, sender=AuthToken)
+def evict_token(sender, instance, **kwargs):
+    """ Stop authenticating a deleted token """
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def evict_user_tokens(sender, instance, **kwargs):
+    """ Stop serving a stale or deactivated user from the token cache """
+    token_cache.delete_user(instance.pk)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """ Count and time the queries of requests sampled for metrics """
+    # The wrappers outlive reconnections of the same connection
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
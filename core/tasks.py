@@ -0,0 +1,63 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+def _run(func, *args):
+    """ Run a task, logging failures and releasing its db connection """
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Background task %s failed', func.__name__)
+    finally:
+        close_old_connections()
+
+
+class ThreadPoolRunner:
+    """ Run tasks in a bounded pool of worker threads """
+
+    def __init__(self):
+        self.executor = self._executor()
+
+    def _executor(self):
+        return ThreadPoolExecutor(
+            max_workers=settings.TASK_RUNNER_WORKERS,
+            thread_name_prefix='task'
+        )
+
+    def submit(self, func, *args):
+        self.executor.submit(_run, func, *args)
+
+    def drain(self):
+        """ Wait for the tasks submitted so far to finish """
+        executor, self.executor = self.executor, self._executor()
+        executor.shutdown(wait=True)
+
+
+class ImmediateRunner:
+    """ Run tasks synchronously in the calling thread, used in tests """
+
+    def submit(self, func, *args):
+        func(*args)
+
+    def drain(self):
+        pass
+
+
+# Runner instances by class path, so each pool is only created once
+_runners = {}
+
+
+def get_runner():
+    """ Return the runner configured by the TASK_RUNNER setting """
+    path = settings.TASK_RUNNER
+    if path not in _runners:
+        _runners[path] = import_string(path)()
+
+    return _runners[path]
@@ -0,0 +1,23 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from core.throttling import reset
+
+
+class TestRunner(DiscoverRunner):
+    """ Run the tests with the throttle budgets turned off
+
+    Budgets are kept in the cache and in process, and would otherwise run
+    out across tests depending on their order. The throttling tests set the
+    rates they check.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.throttle_rates = override_settings(THROTTLE_RATES={})
+        self.throttle_rates.enable()
+        reset()
+
+    def teardown_test_environment(self, **kwargs):
+        self.throttle_rates.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import TransactionTestCase
+
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.async_views import async_offload_view, async_read_view, \
+                             login_executor
+from core.models import Recipe
+from recipe.views import RecipeViewSet
+from user.views import CreateTokenView
+
+
+def thread_view(request):
+    """ Respond with the name of the thread the view ran in """
+    return HttpResponse(threading.current_thread().name)
+
+
+# The executor threads use their own db connections, so the data has to be
+#  committed for them to see it
+class AsyncReadViewTests(TransactionTestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def test_reads_run_in_executor(self):
+        """ Test reads run in the executor and writes do not """
+        view = async_to_sync(async_read_view(thread_view))
+
+        read = view(self.factory.get('/'))
+        write = view(self.factory.post('/'))
+
+        self.assertTrue(read.content.startswith(b'async-view'))
+        self.assertFalse(write.content.startswith(b'async-view'))
+
+    def test_offloaded_writes_run_in_pool(self):
+        """ Test every request of an offloaded view runs in its pool """
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='login')
+        self.addCleanup(pool.shutdown)
+        view = async_to_sync(async_offload_view(thread_view, pool))
+
+        res = view(self.factory.post('/'))
+
+        self.assertTrue(res.content.startswith(b'login'))
+
+    def test_token_view(self):
+        """ Test a login waits for its hash in the login executor """
+        get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        view = async_offload_view(CreateTokenView.as_view(), login_executor)
+        request = self.factory.post(
+            '/api/user/token/',
+            {'email': 'test@londonappdev.com', 'password': 'testpass'}
+        )
+
+        res = async_to_sync(view)(request)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(b'"token"', res.content)
+
+    def test_recipe_list(self):
+        """ Test the recipe list is rendered by the async read view """
+        user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        Recipe.objects.create(
+            user=user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=5.00
+        )
+        view = async_read_view(RecipeViewSet.as_view({'get': 'list'}))
+        request = self.factory.get('/api/recipe/recipes/')
+        force_authenticate(request, user=user)
+
+        res = async_to_sync(view)(request)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(b'Sample recipe', res.content)
+        self.assertEqual(res['Content-Type'], 'application/json')
@@ -0,0 +1,107 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.authentication import TokenCache, token_cache
+from core.models import AuthToken
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """ Test authenticating with the cached token lookup """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.token = AuthToken.objects.issue(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    @override_settings(RECIPE_API_CACHE_TIMEOUT=300)
+    def test_token_lookup_cached(self):
+        """ Test the token is only looked up on the first request """
+        self.client.get(TAGS_URL)
+        self.assertEqual(token_cache.misses, 1)
+
+        # The cache generation and list responses are cached as well so
+        #  the repeated request does not touch the database at all
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.hits, 1)
+
+    def test_deleted_token_evicted(self):
+        """ Test a deleted token stops authenticating """
+        self.client.get(TAGS_URL)
+
+        self.token.delete()
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_token_rejected(self):
+        """ Test a cached token stops authenticating once expired """
+        self.client.get(TAGS_URL)
+
+        later = self.token.expires_at + timedelta(seconds=1)
+        with patch('django.utils.timezone.now', return_value=later):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_deactivated_user_evicted(self):
+        """ Test a deactivated user's token stops authenticating """
+        self.client.get(TAGS_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenCacheTests(TestCase):
+    """ Test the bounded token cache """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+
+    def test_least_recently_used_evicted(self):
+        """ Test the least recently used token is evicted when full """
+        cache = TokenCache(max_size=2, ttl=60)
+        cache.set('a', (self.user, 'a'))
+        cache.set('b', (self.user, 'b'))
+        cache.get('a')
+
+        cache.set('c', (self.user, 'c'))
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    @patch('time.monotonic')
+    def test_expired_token_evicted(self, monotonic):
+        """ Test tokens are evicted once their TTL passed """
+        cache = TokenCache(max_size=2, ttl=60)
+        monotonic.return_value = 100
+        cache.set('a', (self.user, 'a'))
+
+        monotonic.return_value = 161
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.misses, 1)
@@ -1,25 +1,447 @@
-from unittest.mock import patch
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, \
+                        override_settings
+from django.utils import timezone
+
+from core.management.commands.gc_media import Command as GcMedia, \
+                                              shard_of
+from core.models import Tag, Recipe, AuthToken
 
 
 # We are overriding default behavour of the database, to test that functions
 #  behave as expected when the database is available or not, without relying
 #  on the actual resource
-class CommandTests(TestCase):
+CONNECTIONS = 'core.management.commands.wait_for_db.connections'
+MIGRATION_EXECUTOR = 'core.management.commands.wait_for_db.MigrationExecutor'
+SHARD_OF = 'core.management.commands.gc_media.shard_of'
+
+
+class CommandTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = patch(CONNECTIONS)
+        self.addCleanup(patcher.stop)
+        self.connection = patcher.start().__getitem__.return_value
+        self.connection.in_atomic_block = False
 
     def test_wait_for_db_ready(self):
         """ Test waiting for db when db is available """
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1)
+        out = StringIO()
+        call_command('wait_for_db', stdout=out)
+
+        self.assertEqual(self.connection.cursor.call_count, 1)
+        self.assertIn('Ready after 1 attempts', out.getvalue())
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         """ Test waiting for db """
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+        self.connection.cursor.side_effect = \
+            [OperationalError] * 5 + [MagicMock()]
+        call_command('wait_for_db', stdout=StringIO())
+
+        self.assertEqual(self.connection.cursor.call_count, 6)
+        # The broken connection is dropped after each failed attempt
+        self.assertEqual(self.connection.close.call_count, 5)
+        # Exponential backoff with jitter, capped by the maximum delay
+        delays = [call.args[0] for call in ts.call_args_list]
+        self.assertEqual(len(delays), 5)
+        for attempt, delay in enumerate(delays):
+            self.assertLessEqual(delay, min(0.5 * 2 ** attempt, 10))
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_in_atomic_block(self, ts):
+        """ Test the connection is not closed within an atomic block """
+        self.connection.in_atomic_block = True
+        self.connection.cursor.side_effect = [OperationalError, MagicMock()]
+        call_command('wait_for_db', stdout=StringIO())
+
+        self.assertEqual(self.connection.cursor.call_count, 2)
+        self.connection.close.assert_not_called()
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_deadline(self, ts):
+        """ Test waiting gives up once the timeout passed """
+        self.connection.cursor.side_effect = OperationalError
+        with patch('time.monotonic', side_effect=[0, 5, 61]):
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', stdout=StringIO())
+
+        self.assertEqual(ts.call_count, 1)
+
+    @patch('time.sleep', return_value=True)
+    @patch(MIGRATION_EXECUTOR)
+    def test_wait_for_db_pending_migrations(self, executor, ts):
+        """ Test waiting until the pending migrations are applied """
+        plan = executor.return_value.migration_plan
+        plan.side_effect = [['0013_authtoken'], []]
+        call_command('wait_for_db', check_migrations=True, stdout=StringIO())
+
+        self.assertEqual(plan.call_count, 2)
+        self.assertEqual(ts.call_count, 1)
+
+
+class ImportRecipesCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def _write(self, name, content):
+        """ Write a file to the temporary directory and return its path """
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def _import(self, path, **options):
+        call_command(
+            'import_recipes',
+            path,
+            email=self.user.email,
+            stdout=StringIO(),
+            **options
+        )
+
+    def test_import_ndjson(self):
+        """ Test importing recipes reuses and creates tags by name """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        records = [
+            {'title': 'Curry', 'time_minutes': 20, 'price': '7.00',
+             'tags': ['Vegan', 'Dinner'], 'ingredients': ['Rice']},
+            {'title': 'Salad', 'time_minutes': 5, 'price': '3.50',
+             'tags': ['Vegan'], 'ingredients': []},
+        ]
+        path = self._write(
+            'recipes.ndjson',
+            ''.join(json.dumps(record) + '\n' for record in records)
+        )
+
+        self._import(path, batch_size=1)
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        salad = Recipe.objects.get(title='Salad')
+        self.assertEqual(list(salad.tags.all()), [tag])
+        curry = Recipe.objects.get(title='Curry')
+        self.assertEqual(curry.ingredients.get().name, 'Rice')
+
+    def test_import_csv(self):
+        """ Test importing recipes from CSV """
+        path = self._write(
+            'recipes.csv',
+            'title,time_minutes,price,link,tags,ingredients\n'
+            'Curry,20,7.00,,Vegan|Dinner,Rice\n'
+        )
+
+        self._import(path)
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.tags.count(), 2)
+
+    def test_import_resumes_from_checkpoint(self):
+        """ Test records before the checkpoint are skipped """
+        records = [
+            {'title': f'Recipe {i}', 'time_minutes': 5, 'price': '1.00'}
+            for i in range(3)
+        ]
+        path = self._write(
+            'recipes.ndjson',
+            ''.join(json.dumps(record) + '\n' for record in records)
+        )
+        checkpoint = self._write('checkpoint', '2')
+
+        self._import(path, checkpoint=checkpoint)
+
+        self.assertEqual(Recipe.objects.get().title, 'Recipe 2')
+        with open(checkpoint) as file:
+            self.assertEqual(file.read(), '3')
+
+    @patch('time.monotonic', return_value=0)
+    def test_import_clock_not_advanced(self, monotonic):
+        """ Test a batch imported within one clock tick reports no rate """
+        path = self._write(
+            'recipes.ndjson',
+            json.dumps({'title': 'Curry', 'time_minutes': 5, 'price': '1.00'})
+        )
+        out = StringIO()
+
+        call_command(
+            'import_recipes', path, email=self.user.email, stdout=out
+        )
+
+        self.assertIn('(n/a records/sec)', out.getvalue())
+        self.assertTrue(Recipe.objects.filter(title='Curry').exists())
+
+
+class GcMediaCommandTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(
+            os.path.join(self.media_root.name, 'uploads/recipe/renditions')
+        )
+
+        user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        Recipe.objects.create(
+            user=user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=5.00,
+            image='uploads/recipe/a1.jpg',
+            image_thumbnail='uploads/recipe/renditions/a1-thumbnail.jpg'
+        )
+        for name in ('a1.jpg', 'b2.jpg', 'renditions/a1-thumbnail.jpg',
+                     'renditions/b2-thumbnail.jpg', 'legacy.jpg'):
+            self._touch(name, age=7200)
+
+    def _touch(self, name, age):
+        path = self._path(name)
+        open(path, 'wb').close()
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+
+    def _path(self, name):
+        return os.path.join(self.media_root.name, 'uploads/recipe', name)
+
+    def _gc(self, **options):
+        out = StringIO()
+        call_command('gc_media', stdout=out, **options)
+        return out.getvalue()
+
+    def test_gc_deletes_orphans(self):
+        """ Test unreferenced images and renditions are deleted """
+        self._gc()
+
+        self.assertTrue(os.path.exists(self._path('a1.jpg')))
+        self.assertTrue(
+            os.path.exists(self._path('renditions/a1-thumbnail.jpg'))
+        )
+        self.assertFalse(os.path.exists(self._path('b2.jpg')))
+        self.assertFalse(
+            os.path.exists(self._path('renditions/b2-thumbnail.jpg'))
+        )
+        self.assertFalse(os.path.exists(self._path('legacy.jpg')))
+
+    def test_gc_dry_run(self):
+        """ Test a dry run reports orphans without deleting them """
+        out = self._gc(dry_run=True)
+
+        self.assertIn('Found uploads/recipe/b2.jpg', out)
+        self.assertNotIn('uploads/recipe/a1.jpg', out)
+        self.assertTrue(os.path.exists(self._path('b2.jpg')))
+
+    def test_gc_keeps_recent_files(self):
+        """ Test files younger than the minimum age are kept """
+        self._touch('c3.jpg', age=0)
+
+        self._gc()
+
+        self.assertTrue(os.path.exists(self._path('c3.jpg')))
+
+    def test_gc_resumes_from_checkpoint(self):
+        """ Test a sweep limited to some shards resumes where it stopped """
+        checkpoint = os.path.join(self.media_root.name, 'checkpoint')
+
+        # Shards 0, 1, ... a, the orphan in shard b is left for the next run
+        self._gc(checkpoint=checkpoint, max_shards=11)
+        self.assertTrue(os.path.exists(self._path('b2.jpg')))
+        with open(checkpoint) as file:
+            self.assertEqual(file.read(), 'a')
+
+        out = self._gc(checkpoint=checkpoint)
+        self.assertIn('Resuming after shard a', out)
+        self.assertFalse(os.path.exists(self._path('b2.jpg')))
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_gc_lists_each_directory_once(self):
+        """ Test a sweep of every shard lists each directory only once """
+        with patch('os.scandir', wraps=os.scandir) as scandir:
+            self._gc()
+
+        self.assertEqual(scandir.call_count, 2)
+        self.assertFalse(os.path.exists(self._path('b2.jpg')))
+
+    def test_gc_checks_batches_while_listing(self):
+        """ Test a full batch is checked before the listing finishes """
+        checks = []
+        orphans = GcMedia._orphans
+
+        def check(command, batch):
+            checks.append((shard.call_count, len(batch)))
+            return orphans(command, batch)
+
+        with patch(SHARD_OF, wraps=shard_of) as shard, \
+                patch.object(GcMedia, '_orphans', autospec=True,
+                             side_effect=check):
+            self._gc(batch_size=1)
+
+        # shard_of is called once for each listed entry
+        self.assertLess(checks[0][0], shard.call_count)
+        self.assertEqual({size for _, size in checks}, {1})
+        self.assertFalse(os.path.exists(self._path('b2.jpg')))
+
+
+class ClearExpiredTokensCommandTests(TestCase):
+
+    def test_clear_expired_tokens(self):
+        """ Test expired tokens are deleted in batches and valid ones kept """
+        users = [
+            get_user_model().objects.create_user(
+                f'test{i}@londonappdev.com',
+                'testpass'
+            )
+            for i in range(3)
+        ]
+        tokens = [AuthToken.objects.issue(user) for user in users]
+        AuthToken.objects.filter(pk__in=[tokens[0].pk, tokens[1].pk]) \
+            .update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        out = StringIO()
+        call_command('clear_expired_tokens', batch_size=1, stdout=out)
+
+        self.assertIn('Deleted 2 expired tokens', out.getvalue())
+        self.assertEqual(
+            list(AuthToken.objects.values_list('pk', flat=True)),
+            [tokens[2].pk]
+        )
+
+
+class BenchmarkCommandTests(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.output = os.path.join(self.dir.name, 'results.json')
+
+    def _benchmark(self, **options):
+        out = StringIO()
+        options.setdefault(
+            'confirm_database', connection.settings_dict['NAME']
+        )
+        call_command(
+            'benchmark', recipes=20, requests=3, batch_size=8,
+            output=self.output, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_benchmark_seeds_and_writes_results(self):
+        """ Test the scenarios run on seeded data and results are saved """
+        self._benchmark()
+
+        with open(self.output) as file:
+            results = json.load(file)
+        self.assertEqual(results['meta']['recipes_per_user'], 20)
+        for name in ('list', 'filter', 'detail', 'create'):
+            self.assertEqual(results['scenarios'][name]['statuses'], {
+                '201' if name == 'create' else '200': 3
+            })
+            self.assertGreater(results['scenarios'][name]['max_queries'], 0)
+        self.assertEqual(
+            results['scenarios']['upload-image']['statuses'], {'200': 3}
+        )
+        # Created recipes are removed, the data set is reused next run
+        self.assertEqual(Recipe.objects.count(), 20)
+        self._benchmark(scenario=['detail'])
+        self.assertEqual(Recipe.objects.count(), 20)
+        # Uploaded images are put back and the issued tokens deleted
+        self.assertFalse(Recipe.objects.exclude(image='').exists())
+        self.assertFalse(AuthToken.objects.exists())
+
+    def test_benchmark_requires_database_confirmation(self):
+        """ Test the benchmark only writes to the database it is given """
+        with self.assertRaises(CommandError):
+            self._benchmark(confirm_database='production')
+
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_benchmark_flags_regressions(self):
+        """ Test slower scenarios than the compared run are regressions """
+        baseline = os.path.join(self.dir.name, 'baseline.json')
+        with open(baseline, 'w') as file:
+            json.dump({'scenarios': {
+                'detail': {'p50_ms': 0.001, 'max_queries': 0},
+            }}, file)
+
+        out = self._benchmark(scenario=['detail'], compare=baseline)
+        self.assertIn('Regression detail: p50', out)
+        self.assertIn('Regression detail: queries', out)
+
+        with self.assertRaises(CommandError):
+            self._benchmark(
+                scenario=['detail'], compare=baseline,
+                fail_on_regression=True
+            )
+
+    def test_benchmark_path_of_existing_user(self):
+        """ Test benchmarking a path with the data of an existing user """
+        user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        recipe = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=5, price=5.00,
+            image='uploads/recipe/curry.jpg'
+        )
+        token = AuthToken.objects.issue(user)
+
+        out = self._benchmark(
+            email=user.email, scenario=['detail', 'upload-image'],
+            path=['/api/recipe/tags/?assigned_only=1']
+        )
+
+        self.assertIn('GET /api/recipe/tags/?assigned_only=1: ', out)
+        with open(self.output) as file:
+            results = json.load(file)
+        self.assertEqual(
+            results['scenarios']['GET /api/recipe/tags/?assigned_only=1']
+            ['statuses'],
+            {'200': 3}
+        )
+        self.assertFalse(
+            get_user_model().objects.filter(email__startswith='benchmark')
+            .exists()
+        )
+        # The user's own token and image are left as they were
+        self.assertTrue(AuthToken.objects.filter(key=token.key).exists())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, 'uploads/recipe/curry.jpg')
+
+
+class BenchmarkAsgiCommandTests(TransactionTestCase):
+
+    def test_benchmark_asgi_handler(self):
+        """ Test requests run concurrently through the ASGI handler """
+        out = StringIO()
+        call_command(
+            'benchmark', recipes=5, requests=4, concurrency=2,
+            handler='asgi', scenario=['list', 'create'], stdout=out,
+            confirm_database=connection.settings_dict['NAME']
+        )
+
+        self.assertIn("list: ", out.getvalue())
+        self.assertIn("statuses {'200': 4}", out.getvalue())
+        self.assertIn("statuses {'201': 4}", out.getvalue())
+        self.assertEqual(Recipe.objects.count(), 5)
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from core.db.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """ Test the in-process connection pool """
+
+    def test_connections_reused(self):
+        """ Test a returned connection is handed out again """
+        pool = ConnectionPool(FakeConnection, size=2)
+        connection = pool.get()
+        pool.put(connection)
+
+        self.assertIs(pool.get(), connection)
+        self.assertEqual(pool.stats()['open'], 1)
+
+    def test_overflow_closed_when_returned(self):
+        """ Test connections past the size are closed once returned """
+        pool = ConnectionPool(FakeConnection, size=1, max_overflow=1)
+        first, second = pool.get(), pool.get()
+
+        pool.put(second)
+        pool.put(first)
+
+        self.assertTrue(second.closed)
+        self.assertFalse(first.closed)
+        self.assertEqual(pool.stats()['open'], 1)
+
+    def test_timeout_when_exhausted(self):
+        """ Test waiting for a connection gives up after the timeout """
+        pool = ConnectionPool(FakeConnection, size=1, timeout=0.01)
+        pool.get()
+
+        with self.assertRaises(PoolTimeout):
+            pool.get()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiter_gets_returned_connection(self):
+        """ Test a waiting caller gets the next returned connection """
+        pool = ConnectionPool(FakeConnection, size=1, timeout=5)
+        connection = pool.get()
+        timer = threading.Timer(0.05, pool.put, [connection])
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        self.assertIs(pool.get(), connection)
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreaterEqual(stats['max_wait_time'], 0.04)
+
+    def test_broken_connections_discarded(self):
+        """ Test connections failing the reset or check are replaced """
+        broken = set()
+        pool = ConnectionPool(
+            FakeConnection,
+            size=2,
+            reset=lambda connection: connection not in broken,
+            check=lambda connection: connection not in broken
+        )
+        first = pool.get()
+        broken.add(first)
+        pool.put(first)
+        self.assertTrue(first.closed)
+
+        second = pool.get()
+        pool.put(second)
+        broken.add(second)
+
+        third = pool.get()
+        self.assertTrue(second.closed)
+        self.assertIsNot(third, second)
+        self.assertEqual(pool.stats()['open'], 1)
+
+    def test_failed_connect_frees_slot(self):
+        """ Test a connection that fails to open does not use up the pool """
+        attempts = []
+
+        def connect():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise OSError('refused')
+            return FakeConnection()
+
+        pool = ConnectionPool(connect, size=1, timeout=0.01)
+        with self.assertRaises(OSError):
+            pool.get()
+
+        self.assertIsInstance(pool.get(), FakeConnection)
@@ -0,0 +1,37 @@
+from django.test import TestCase, override_settings
+
+from core.hashers import ScryptPasswordHasher
+
+
+class ScryptPasswordHasherTests(TestCase):
+
+    def setUp(self):
+        self.hasher = ScryptPasswordHasher()
+
+    def test_verify(self):
+        """ Test a password verifies against its own hash only """
+        encoded = self.hasher.encode('testpass', self.hasher.salt())
+
+        self.assertTrue(encoded.startswith('scrypt$16384$'))
+        self.assertTrue(self.hasher.verify('testpass', encoded))
+        self.assertFalse(self.hasher.verify('wrong', encoded))
+
+    def test_verify_with_parallelism(self):
+        """ Test the memory limit allows for the parallelism """
+        # Parallel blocks need more memory than the work factor's alone
+        encoded = self.hasher.encode(
+            'testpass', self.hasher.salt(), n=16, r=1, p=32
+        )
+
+        self.assertEqual(self.hasher.decode(encoded)['parallelism'], 32)
+        self.assertTrue(self.hasher.verify('testpass', encoded))
+
+    def test_must_update_when_work_factor_changes(self):
+        """ Test hashes made with another work factor are upgraded """
+        encoded = self.hasher.encode('testpass', self.hasher.salt())
+        self.assertFalse(self.hasher.must_update(encoded))
+
+        with override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 15):
+            self.assertTrue(self.hasher.must_update(encoded))
+            # Old hashes still verify with the cost they were made with
+            self.assertTrue(self.hasher.verify('testpass', encoded))
@@ -0,0 +1,122 @@
+import io
+import os
+import tempfile
+from wsgiref.util import setup_testing_defaults
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+
+class SendfileWrapper:
+    """ A wsgi.file_wrapper sending from the descriptor when there is one """
+
+    def __init__(self, file, block_size=8192):
+        self.file = file
+
+    def __iter__(self):
+        if hasattr(self.file, 'fileno'):
+            # Like sendfile(), from the current offset to the end of file
+            yield os.read(self.file.fileno(), 1 << 20)
+        else:
+            yield self.file.read()
+
+    def close(self):
+        self.file.close()
+
+
+class MediaServingTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        os.makedirs(os.path.join(self.media_root.name, 'uploads/recipe'))
+        self.content = bytes(range(100))
+        path = os.path.join(self.media_root.name, 'uploads/recipe/test.jpg')
+        with open(path, 'wb') as file:
+            file.write(self.content)
+        self.url = reverse('media', args=['uploads/recipe/test.jpg'])
+
+    def test_serve_file(self):
+        """ Test files are served with long lived cache headers """
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), self.content)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Content-Length'], '100')
+        self.assertIn('immutable', res['Cache-Control'])
+
+    def test_serve_range(self):
+        """ Test a byte range is served as partial content """
+        res = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), self.content[10:20])
+        self.assertEqual(res['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(res['Content-Length'], '10')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_serve_range_through_file_wrapper(self):
+        """ Test a server's file wrapper only sends the requested range """
+        environ = {
+            'PATH_INFO': self.url,
+            'HTTP_HOST': 'testserver',
+            'HTTP_RANGE': 'bytes=10-19',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.file_wrapper': SendfileWrapper,
+        }
+        setup_testing_defaults(environ)
+        statuses = []
+
+        res = WSGIHandler()(
+            environ,
+            lambda status, headers: statuses.append(status)
+        )
+        body = b''.join(res)
+        res.close()
+
+        self.assertEqual(statuses, ['206 Partial Content'])
+        self.assertEqual(body, self.content[10:20])
+
+    def test_serve_suffix_range(self):
+        """ Test a suffix byte range serves the end of the file """
+        res = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+
+        self.assertEqual(b''.join(res.streaming_content), self.content[-5:])
+
+    def test_serve_unsatisfiable_range(self):
+        """ Test a range past the end of the file is rejected """
+        res = self.client.get(self.url, HTTP_RANGE='bytes=200-')
+
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], 'bytes */100')
+
+    def test_serve_not_modified(self):
+        """ Test unchanged files are answered with 304 """
+        last_modified = self.client.get(self.url)['Last-Modified']
+
+        res = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, 304)
+
+    def test_serve_outside_media_root(self):
+        """ Test paths escaping the media root are rejected """
+        res = self.client.get(reverse('media', args=['../../etc/passwd']))
+
+        self.assertEqual(res.status_code, 400)
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel-redirect')
+    def test_serve_x_accel_redirect(self):
+        """ Test files can be handed off to nginx """
+        res = self.client.get(self.url)
+
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            '/protected-media/uploads/recipe/test.jpg'
+        )
+        self.assertEqual(res.content, b'')
@@ -0,0 +1,115 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.metrics import Registry, registry
+from core.models import Recipe
+from core.throttling import reset
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+METRICS_URL = reverse('metrics')
+SERIES = '{method="GET",route="recipe:recipe-list"}'
+
+
+class MetricsMiddlewareTests(TestCase):
+    """ Test recording request metrics """
+
+    def setUp(self):
+        reset()
+        registry.clear()
+        self.addCleanup(registry.clear)
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=5.00
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_sampled_request_recorded(self):
+        """ Test the queries and timings of a sampled request are recorded """
+        with self.assertNumQueries(4):
+            self.client.get(RECIPES_URL)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        body = res.content.decode()
+        self.assertIn(f'http_request_db_queries_sum{SERIES} 4', body)
+        self.assertIn(f'http_request_duration_seconds_count{SERIES} 1', body)
+        self.assertIn(
+            'http_request_serializer_duration_seconds_count'
+            f'{SERIES} 1',
+            body
+        )
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_request_not_recorded(self):
+        """ Test nothing is recorded when sampling is off """
+        self.client.get(RECIPES_URL)
+
+        self.assertEqual(registry.render(), [])
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_metrics_forbidden_to_other_addresses(self):
+        """ Test the metrics are only served to the allowed addresses """
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_metrics_loopback_only_by_default(self):
+        """ Test the metrics are only served to loopback unless configured """
+        self.assertEqual(
+            self.client.get(METRICS_URL).status_code,
+            status.HTTP_200_OK
+        )
+
+        res = self.client.get(METRICS_URL, REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS_ALLOWED_IPS=['*'])
+    def test_metrics_served_to_any_address(self):
+        """ Test the metrics can be opened to every address """
+        res = self.client.get(METRICS_URL, REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class RegistryTests(TestCase):
+
+    def test_render_cumulative_buckets(self):
+        """ Test histograms render with cumulative bucket counts """
+        metrics = Registry()
+        for value in (1, 3, 300):
+            metrics.observe(
+                'http_request_db_queries',
+                {'route': 'r', 'method': 'GET'},
+                value
+            )
+
+        lines = metrics.render()
+
+        labels = 'method="GET",route="r"'
+        self.assertIn('# TYPE http_request_db_queries histogram', lines)
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="1"}} 1',
+                      lines)
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="5"}} 2',
+                      lines)
+        self.assertIn(
+            f'http_request_db_queries_bucket{{{labels},le="+Inf"}} 3',
+            lines
+        )
+        self.assertIn(f'http_request_db_queries_sum{{{labels}}} 304.0',
+                      lines)
@@ -87,3 +87,16 @@ class ModelTests(TestCase):
 
         exp_path = f'uploads/recipe/{uuid}.jpg'
         self.assertEqual(file_path, exp_path)
+
+    def test_issue_token_concurrent_first_login(self):
+        """ Test a token created by a concurrent login is returned """
+        user = sample_user()
+        token = models.AuthToken.objects.issue(user)
+
+        # Both logins found no token to lock
+        with patch('django.db.models.query.QuerySet.first',
+                   return_value=None):
+            issued = models.AuthToken.objects.issue(user)
+
+        self.assertEqual(issued.key, token.key)
+        self.assertEqual(models.AuthToken.objects.count(), 1)
@@ -0,0 +1,143 @@
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, \
+                        override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import routers
+from core.cache import check_shared_caches
+from core.models import Recipe
+from core.throttling import reset
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+LOCAL_CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+}}
+
+
+class ReplicaRouterTests(TestCase):
+    """ Test routing reads to the replicas """
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_reads_routed_inside_block(self):
+        """ Test only reads inside read_from_replica go to a replica """
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+        with routers.read_from_replica():
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica_1')
+            self.assertEqual(self.router.db_for_write(Recipe), 'default')
+
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        """ Test reads go to the primary when there are no replicas """
+        with routers.read_from_replica():
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+
+@override_settings(RECIPE_API_CACHE_TIMEOUT=0)
+class ReplicaCacheTests(SimpleTestCase):
+    """ Test replicas need the sticky flags shared between processes """
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'], CACHES=LOCAL_CACHES)
+    def test_local_memory_refused(self):
+        """ Test replicas with a local memory cache fail to start """
+        with self.assertRaises(ImproperlyConfigured):
+            check_shared_caches()
+
+    @override_settings(
+        DATABASE_REPLICAS=['replica_1'],
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }}
+    )
+    def test_shared_backend(self):
+        """ Test replicas with a cache outside the process are accepted """
+        check_shared_caches()
+
+
+# Reads stay on the primary, the replica is only asked for
+@override_settings(DATABASE_REPLICAS=[])
+@patch('recipe.mixins.read_from_replica', wraps=routers.read_from_replica)
+class ReplicaReadMixinTests(TestCase):
+    """ Test the recipe API picks replica reads per request """
+
+    def setUp(self):
+        reset()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_safe_requests_read_from_replica(self, read_from_replica):
+        """ Test GET requests read from a replica """
+        self.client.get(RECIPES_URL)
+
+        read_from_replica.assert_called_once()
+
+    def test_reads_stick_to_primary_after_write(self, read_from_replica):
+        """ Test a user reads from the primary right after a write """
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.client.get(TAGS_URL)
+        read_from_replica.assert_not_called()
+
+        # Other users are not affected
+        other = get_user_model().objects.create_user(
+            'other@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(other)
+        self.client.get(TAGS_URL)
+        read_from_replica.assert_called_once()
+
+
+# Needs a replica alias, eg. DB_REPLICA_HOSTS=localhost to use the primary
+#  as its own replica, and a shared CACHE_BACKEND. Data has to be
+#  committed for the replica connection to see it
+@skipUnless(settings.DATABASE_REPLICAS, 'No replica configured')
+class ReplicaQueriesTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        reset()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=5.00
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_queries_replica(self):
+        """ Test the recipe list is read from the replica """
+        replica = connections[settings.DATABASE_REPLICAS[0]]
+        with CaptureQueriesContext(replica) as queries:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertTrue(queries.captured_queries)
@@ -0,0 +1,128 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import TokenBucketThrottle, reset
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+TOKEN_URL = reverse('user:token')
+
+RATES = {
+    'user': '100/min',
+    'recipe': '2/min',
+    'token': '1/hour',
+    'user_create': None,
+}
+
+
+@override_settings(THROTTLE_RATES=RATES, THROTTLE_LEASE_SIZE=1)
+class TokenBucketThrottleTests(TestCase):
+    """ Test the token bucket throttles """
+
+    def setUp(self):
+        reset()
+        self.addCleanup(reset)
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipe_budget_exhausted(self):
+        """ Test requests past the burst are refused with a Retry-After """
+        for _ in range(2):
+            res = self.client.get(RECIPES_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
+
+    def test_budget_per_user(self):
+        """ Test one user exhausting a budget does not throttle another """
+        for _ in range(3):
+            self.client.get(RECIPES_URL)
+        other = get_user_model().objects.create_user(
+            'other@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_budget_per_endpoint(self):
+        """ Test an exhausted recipe budget leaves other endpoints alone """
+        for _ in range(3):
+            self.client.get(RECIPES_URL)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(THROTTLE_RATES=dict(RATES, user='2/min'))
+    def test_user_budget_across_endpoints(self):
+        """ Test the user budget is shared by every endpoint """
+        self.client.get(TAGS_URL)
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_login_throttled(self):
+        """ Test logins are throttled per client """
+        payload = {'email': 'test@londonappdev.com', 'password': 'testpass'}
+        client = APIClient()
+        self.assertEqual(
+            client.post(TOKEN_URL, payload).status_code,
+            status.HTTP_200_OK
+        )
+
+        res = client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(THROTTLE_LEASE_SIZE=5)
+    def test_leased_tokens_spent_locally(self):
+        """ Test leased tokens and refusals do not touch the cache """
+        lease = TokenBucketThrottle.lease
+        with patch.object(TokenBucketThrottle, 'lease', autospec=True,
+                          side_effect=lease) as mock_lease:
+            for _ in range(2):
+                self.client.get(RECIPES_URL)
+            res = self.client.get(RECIPES_URL)
+            self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # One lease per bucket (user and recipe), the refusal of the last
+        #  request is remembered locally
+        self.assertEqual(mock_lease.call_count, 3)
+
+
+class TestRunnerThrottleTests(TestCase):
+    """ Test the budgets do not carry over from one test to the next """
+
+    def test_rates_off_during_tests(self):
+        """ Test logins past the default budget are not throttled """
+        get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        client = APIClient()
+        payload = {'email': 'test@londonappdev.com', 'password': 'testpass'}
+
+        # The default 'token' budget is 30 per minute
+        for _ in range(31):
+            res = client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
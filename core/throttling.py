@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """ Return (capacity, tokens per second) of a rate like '100/min' """
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    try:
+        seconds = PERIODS[period[0]]
+    except (IndexError, KeyError):
+        raise ImproperlyConfigured(f'Invalid throttle rate {rate!r}')
+
+    return int(count), int(count) / seconds
+
+
+class LocalLeases:
+    """ Tokens taken from the shared buckets, spent without the cache
+
+    Requests first spend tokens leased by this process, and clients known to
+    be out of tokens are refused until they refill, so most checks never
+    leave the process. Leasing takes tokens out of the shared bucket up
+    front, so leases never let more requests through than the bucket.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        # key -> [leased tokens, refused until (monotonic)]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, now):
+        """ Spend a leased token: True, refused: wait seconds, else None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            if entry[0] > 0:
+                entry[0] -= 1
+                return True
+            if entry[1] > now:
+                return entry[1] - now
+            return None
+
+    def store(self, key, tokens, refused_until=0):
+        with self._lock:
+            self._entries[key] = [tokens, refused_until]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+leases = LocalLeases(settings.THROTTLE_LOCAL_SIZE)
+
+
+def reset():
+    """ Forget all throttle state, used in tests """
+    leases.clear()
+    caches[settings.THROTTLE_CACHE_ALIAS].clear()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """ Token bucket throttle, kept in the THROTTLE_CACHE_ALIAS cache
+
+    Each client has a bucket of `capacity` tokens refilling at the rate of
+    its scope in THROTTLE_RATES, every request spends one token. Buckets are
+    only shared between processes if the cache is, with local memory each
+    process enforces the rates on its own.
+    """
+    scope = None
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_scope(self, view):
+        return self.scope
+
+    def get_cache_key(self, request, view):
+        """ Return the bucket key of the client """
+        user = request.user
+        if user is not None and user.is_authenticated:
+            ident = f'user:{user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+
+        return f'throttle:{self.scope}:{ident}'
+
+    def allow_request(self, request, view):
+        self.scope = self.get_scope(view)
+        bucket = parse_rate(settings.THROTTLE_RATES.get(self.scope))
+        if bucket is None:
+            return True
+
+        key = self.get_cache_key(request, view)
+        now = time.monotonic()
+        local = leases.take(key, now)
+        if local is True:
+            return True
+        if local is not None:
+            self.wait_seconds = local
+            return False
+
+        granted, wait = self.lease(key, bucket)
+        if granted:
+            leases.store(key, granted - 1)
+            return True
+
+        leases.store(key, 0, now + wait)
+        self.wait_seconds = wait
+        return False
+
+    def lease(self, key, bucket):
+        """ Take up to a lease of tokens from the shared bucket
+
+        Return the tokens granted and, when none were, the seconds until one
+        refills. Buckets are read and written without a lock, so concurrent
+        processes may both spend the same refill, which is fine for
+        throttling.
+        """
+        capacity, rate = bucket
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        now = time.time()
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+
+        granted = min(int(tokens), settings.THROTTLE_LEASE_SIZE)
+        tokens -= granted
+        # Expire the bucket once it would be full again anyway
+        cache.set(key, (tokens, now), (capacity - tokens) / rate + 1)
+
+        return granted, 0 if granted else (1 - tokens) / rate
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserBucketThrottle(TokenBucketThrottle):
+    """ Budget of a client across every endpoint """
+    scope = 'user'
+
+
+class ScopedBucketThrottle(TokenBucketThrottle):
+    """ Budget of a client for the endpoints sharing the view's scope """
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
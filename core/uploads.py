@@ -0,0 +1,204 @@
+import hashlib
+import os
+import re
+import tempfile
+from io import BytesIO
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+
+# Image headers are parsed from at most this many leading bytes, uploads
+#  whose dimensions can't be read from them are rejected
+HEADER_LIMIT = 256 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class ImageTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Image is too large.'
+    default_code = 'image_too_large'
+
+
+class UploadConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Chunk does not continue the upload.'
+    default_code = 'upload_conflict'
+
+
+def check_upload_size(size):
+    """ Reject uploads larger than the configured maximum """
+    if size > settings.MAX_IMAGE_UPLOAD_SIZE:
+        raise ImageTooLarge(
+            f'Image is larger than {settings.MAX_IMAGE_UPLOAD_SIZE} bytes.'
+        )
+
+
+def check_dimensions(width, height):
+    """ Reject images larger than the configured maximum on a side """
+    if max(width, height) > settings.MAX_IMAGE_DIMENSION:
+        raise ImageTooLarge(
+            f'Image is larger than {settings.MAX_IMAGE_DIMENSION} pixels '
+            f'on a side.'
+        )
+
+
+def check_image_header(head):
+    """ Check the dimensions in an image header without decoding pixels
+
+    Returns whether the header could be read. Images whose dimensions are
+    not within the first HEADER_LIMIT bytes are rejected.
+    """
+    try:
+        # Opening an image only parses its header
+        with Image.open(BytesIO(head[:HEADER_LIMIT])) as image:
+            width, height = image.size
+    except Exception:
+        if len(head) >= HEADER_LIMIT:
+            raise ValidationError(
+                {'image': ['Image dimensions could not be read.']}
+            )
+        # Not enough data yet, or a small file which is not an image at all
+        #  and is reported by the full validation
+        return False
+
+    check_dimensions(width, height)
+    return True
+
+
+def check_image_dimensions(file):
+    """ Check the dimensions of a complete upload """
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except Exception:
+        # Not an image, reported by the image field's validation
+        return
+    finally:
+        file.seek(0)
+
+    check_dimensions(width, height)
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """ Spool image uploads to disk, rejecting oversized images early """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.head = b''
+        self.header_checked = False
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        check_upload_size(self.received)
+        if not self.header_checked:
+            self.head += raw_data[:HEADER_LIMIT - len(self.head)]
+            self.header_checked = check_image_header(self.head)
+        # Hash while receiving so content addressed storage needs no re-read
+        self.hasher.update(raw_data)
+
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.content_hash = self.hasher.hexdigest()
+
+        return file
+
+
+class AssembledUpload(File):
+    """ An upload assembled on disk, validated and stored from its path """
+
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name)
+        self.path = path
+
+    def temporary_file_path(self):
+        # Lets the image validation open the file from disk and the file
+        #  system storage move it into place instead of copying it
+        return self.path
+
+
+class ResumableUpload:
+    """ An image uploaded in one or more Content-Range chunks """
+
+    def __init__(self, key):
+        directory = os.path.join(
+            settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(),
+            'recipe-uploads'
+        )
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{key}.part')
+
+    @property
+    def received(self):
+        """ Return the number of bytes received so far """
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def receive(self, stream, content_range, content_length):
+        """ Append a chunk from the stream, return whether it is complete """
+        if content_range:
+            match = CONTENT_RANGE_RE.match(content_range)
+            if not match:
+                raise ValidationError({'Content-Range': 'Invalid range.'})
+            start, end, total = (int(value) for value in match.groups())
+        else:
+            start, end = 0, content_length - 1
+            total = content_length
+
+        if end < start or end >= total:
+            raise ValidationError({'Content-Range': 'Invalid range.'})
+        check_upload_size(total)
+        if start == 0:
+            self.discard()
+        elif start != self.received:
+            raise UploadConflict(
+                f'Expected a chunk starting at byte {self.received}.'
+            )
+
+        remaining = end - start + 1
+        with open(self.path, 'ab') as file:
+            while remaining:
+                chunk = stream.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                file.write(chunk)
+                remaining -= len(chunk)
+
+        with open(self.path, 'rb') as file:
+            head = file.read(HEADER_LIMIT)
+        try:
+            check_image_header(head)
+        except (ImageTooLarge, ValidationError):
+            self.discard()
+            raise
+
+        return self.received >= total
+
+    def assembled(self):
+        """ Return the complete upload, named after its image format """
+        try:
+            with Image.open(self.path) as image:
+                extension = (image.format or 'img').lower()
+        except Exception:
+            extension = 'img'
+        extension = {'jpeg': 'jpg'}.get(extension, extension)
+
+        return AssembledUpload(self.path, f'upload.{extension}')
+
+    def discard(self):
+        """ Remove the partial upload """
+        if os.path.exists(self.path):
+            os.remove(self.path)
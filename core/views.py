@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from core.db.backends.postgresql.base import pool_stats
+from core.metrics import registry
+
+
+POOL_COUNTERS = (
+    ('checkouts', 'db_pool_checkouts_total', 'counter',
+     'Connections taken from the pool'),
+    ('waits', 'db_pool_waits_total', 'counter',
+     'Checkouts which waited for a connection'),
+    ('wait_time', 'db_pool_wait_seconds_total', 'counter',
+     'Time spent waiting for a connection'),
+    ('timeouts', 'db_pool_timeouts_total', 'counter',
+     'Checkouts which gave up waiting'),
+    ('open', 'db_pool_open_connections', 'gauge',
+     'Connections open, idle or in use'),
+    ('idle', 'db_pool_idle_connections', 'gauge',
+     'Connections waiting in the pool'),
+)
+
+
+def _pool_lines():
+    """ Return the connection pool counters in the Prometheus format """
+    stats = pool_stats()
+    if not stats:
+        return []
+
+    lines = []
+    for field, name, metric_type, help_text in POOL_COUNTERS:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for alias, values in sorted(stats.items()):
+            lines.append(f'{name}{{database="{alias}"}} {values[field]}')
+
+    return lines
+
+
+def metrics(request):
+    """ Expose the request and pool metrics to Prometheus """
+    # Per route latencies and pool counters are not public, only the
+    #  addresses configured (loopback by default) may read them
+    allowed = settings.METRICS_ALLOWED_IPS
+    if '*' not in allowed and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+
+    lines = registry.render() + _pool_lines()
+    return HttpResponse(
+        ''.join(f'{line}\n' for line in lines),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
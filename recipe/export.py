@@ -0,0 +1,75 @@
+import csv
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.models import Recipe
+
+
+EXPORT_FIELDS = (
+    'id', 'title', 'time_minutes', 'price', 'link', 'tags', 'ingredients',
+)
+# Tag and ingredient names are joined into a single CSV column
+CSV_LIST_SEPARATOR = '|'
+
+
+def _related_names(through, column, recipe_ids):
+    """ Return a map of recipe id to the related names for a chunk """
+    names = {}
+    rows = through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', f'{column}__name').order_by(f'{column}__name')
+    for recipe_id, name in rows:
+        names.setdefault(recipe_id, []).append(name)
+
+    return names
+
+
+def iter_recipes(queryset, chunk_size=1000):
+    """ Yield recipes as dicts, looking up their relations per chunk """
+    rows = queryset.values_list(
+        'id', 'title', 'time_minutes', 'price', 'link'
+    ).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        ids = [row[0] for row in chunk]
+        tags = _related_names(Recipe.tags.through, 'tag', ids)
+        ingredients = _related_names(
+            Recipe.ingredients.through,
+            'ingredient',
+            ids
+        )
+        for row in chunk:
+            recipe = dict(zip(EXPORT_FIELDS, row))
+            recipe['tags'] = tags.get(recipe['id'], [])
+            recipe['ingredients'] = ingredients.get(recipe['id'], [])
+            yield recipe
+
+
+def iter_ndjson(recipes):
+    """ Yield one JSON document per recipe """
+    for recipe in recipes:
+        yield json.dumps(recipe, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Echo:
+    """ File-like object which returns what is written instead of storing """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(recipes):
+    """ Yield a CSV header and one CSV row per recipe """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for recipe in recipes:
+        recipe['tags'] = CSV_LIST_SEPARATOR.join(recipe['tags'])
+        recipe['ingredients'] = CSV_LIST_SEPARATOR.join(
+            recipe['ingredients']
+        )
+        yield writer.writerow([recipe[field] for field in EXPORT_FIELDS])
@@ -0,0 +1,239 @@
+import hashlib
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from core.cache import bump_generation, get_cache, response_cache_key
+from core.routers import is_stuck_to_primary, read_from_replica, \
+                         stick_to_primary
+
+
+class ReplicaReadMixin:
+    """ Read safe requests from a replica, unless the user wrote recently """
+
+    def dispatch(self, request, *args, **kwargs):
+        with ExitStack() as self.replica_reads:
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        # Authenticates the request, against the primary
+        super().initial(request, *args, **kwargs)
+
+        if request.method not in SAFE_METHODS:
+            stick_to_primary(request.user.pk)
+        elif not is_stuck_to_primary(request.user.pk):
+            self.replica_reads.enter_context(read_from_replica())
+
+
+class CachedListMixin:
+    """ Cache list responses per user until one of their objects changes """
+    # Digest of the listed objects, when a mixin before this one reads it
+    list_state = ''
+
+    def list(self, request, *args, **kwargs):
+        """ Return the cached list response or build and cache it """
+        if not settings.RECIPE_API_CACHE_TIMEOUT:
+            return super().list(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = response_cache_key(
+            request.user.id,
+            self.basename,
+            request.query_params,
+            self.list_state
+        )
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        cache.set(key, response.data, settings.RECIPE_API_CACHE_TIMEOUT)
+
+        return response
+
+
+class ConditionalGetMixin:
+    """ Answer unchanged list and detail requests with 304 Not Modified """
+
+    def _conditional(self, request, etag, last_modified=None):
+        """ Return a 304 (or 412) response if the request conditions hold """
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified and last_modified.timestamp()
+        )
+        if response is not None:
+            response['ETag'] = etag
+
+        return response
+
+    def _set_validators(self, response, etag, last_modified=None):
+        """ Add the validators to a response so clients can revalidate """
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """ Return 304 if no recipe in the list changed """
+        queryset = self.filter_queryset(self.get_queryset())
+        state = queryset.aggregate(count=Count('id'), latest=Max('updated_at'))
+        # The count catches deletions which don't move the latest timestamp,
+        #  so lists are only validated by ETag and not Last-Modified
+        digest = hashlib.md5(
+            f'{state["count"]}:{state["latest"]}:'
+            f'{request.get_full_path()}'.encode()
+        ).hexdigest()
+        etag = quote_etag(digest)
+
+        response = self._conditional(request, etag)
+        if response is None:
+            # A cached body is only used if it was built from the same state
+            #  as the ETag, not from a stale cache or a lagging replica
+            self.list_state = digest
+            response = super().list(request, *args, **kwargs)
+
+        return self._set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        """ Return 304 if the object did not change """
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            updated_at = self.get_queryset().prefetch_related(None).filter(
+                **{self.lookup_field: lookup}
+            ).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            updated_at = None
+
+        if updated_at is None:
+            # Let the default handling return the 404
+            return super().retrieve(request, *args, **kwargs)
+
+        etag = quote_etag(f'{lookup}-{updated_at.timestamp()}')
+        response = self._conditional(request, etag, updated_at)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+
+        return self._set_validators(response, etag, updated_at)
+
+
+class BulkMixin:
+    """ Create, update and delete many objects in a single request """
+
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False,
+            url_path='bulk')
+    def bulk(self, request):
+        """ Bulk create (POST), update (PATCH) or delete (DELETE) objects """
+        handler = {
+            'POST': self._bulk_create,
+            'PATCH': self._bulk_update,
+            'DELETE': self._bulk_destroy,
+        }[request.method]
+        items = request.data.get('ids') if isinstance(request.data, dict) \
+            else request.data
+        if isinstance(items, list) and len(items) > settings.BULK_MAX_ITEMS:
+            # Checked before validating, which would hold every item
+            return Response(
+                {'detail': f'At most {settings.BULK_MAX_ITEMS} items '
+                           f'per request.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # All items are stored in one transaction, or none of them are
+        with transaction.atomic():
+            response = handler(request)
+
+        if status.is_success(response.status_code):
+            # Bulk queries skip the model signals which invalidate the cache
+            bump_generation(request.user.id)
+
+        return response
+
+    def _bulk_ids(self, items):
+        """ Return the ids of the items or None if any is missing """
+        if not isinstance(items, list):
+            return None
+        try:
+            return [int(item['id']) for item in items]
+        except (TypeError, KeyError, ValueError):
+            return None
+
+    def _bulk_create(self, request):
+        serializer = self.get_serializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            # Errors are returned per item, in the order of the request
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        self.perform_bulk_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def _bulk_update(self, request):
+        ids = self._bulk_ids(request.data)
+        if ids is None:
+            return Response(
+                {'detail': 'Expected a list of objects with an id.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        instances = self.get_queryset().in_bulk(ids)
+        missing = [
+            {} if pk in instances else {'id': ['Not found.']}
+            for pk in ids
+        ]
+        if any(missing):
+            return Response(missing, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(
+            [instances[pk] for pk in ids],
+            data=request.data,
+            many=True,
+            partial=True
+        )
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        self.perform_bulk_update(serializer)
+        return Response(serializer.data)
+
+    def _bulk_destroy(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) \
+            else None
+        ids = self._bulk_ids([{'id': pk} for pk in ids or ()])
+        if not ids:
+            return Response(
+                {'ids': ['Expected a list of ids.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.get_queryset().filter(id__in=ids)
+        deleted = set(queryset.values_list('id', flat=True))
+        self.perform_bulk_destroy(queryset)
+
+        return Response([
+            {'id': pk, 'deleted': pk in deleted} for pk in ids
+        ])
+
+    def perform_bulk_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def perform_bulk_update(self, serializer):
+        serializer.save()
+
+    def perform_bulk_destroy(self, queryset):
+        queryset.delete()
@@ -0,0 +1,29 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class BaseCursorPagination(CursorPagination):
+    """ Keyset pagination with a client controlled, capped page size """
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class RecipeCursorPagination(BaseCursorPagination):
+    """ Paginate recipes newest first, matching the recipe viewset """
+    ordering = '-id'
+
+
+class RecipeSearchPagination(LimitOffsetPagination):
+    """ Paginate search results by offset, in the queryset's rank order
+
+    Ranks are floats which don't round trip through a cursor and are often
+    tied, so they can't be the position a cursor pages from.
+    """
+    default_limit = 25
+    limit_query_param = 'page_size'
+    max_limit = 100
+
+
+class RecipeAttrCursorPagination(BaseCursorPagination):
+    """ Paginate tags and ingredients by name, matching their viewsets """
+    ordering = '-name'
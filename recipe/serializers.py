@@ -1,27 +1,110 @@
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+
 from rest_framework import serializers
 
+from core.bulk import bulk_create
+from core.metrics import TimedSerializerMixin
 from core.models import Tag, Ingredient, Recipe
+from core.uploads import check_image_dimensions
+
+
+class BulkListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """ Create and update many objects with batched queries """
+
+    def _pop_related(self, attrs):
+        """ Remove and return the many-to-many values of an item """
+        return {
+            field.name: attrs.pop(field.name)
+            for field in self.child.Meta.model._meta.many_to_many
+            if field.name in attrs
+        }
+
+    def _set_related(self, instances, relations):
+        """ Replace the many-to-many values with batched through rows """
+        model = self.child.Meta.model
+        for field in model._meta.many_to_many:
+            through = field.remote_field.through
+            source = field.m2m_column_name()
+            target = field.m2m_reverse_name()
+            changed = [
+                (instance, related[field.name])
+                for instance, related in zip(instances, relations)
+                if field.name in related
+            ]
+            if not changed:
+                continue
 
+            through.objects.filter(
+                **{f'{source}__in': [instance.pk for instance, _ in changed]}
+            ).delete()
+            through.objects.bulk_create([
+                through(**{source: instance.pk, target: obj.pk})
+                for instance, objs in changed
+                # Drop repeated ids which would break the unique constraint
+                for obj in dict.fromkeys(objs)
+            ])
+
+        # Load the new relations for the response in one query per field
+        for instance in instances:
+            instance.__dict__.pop('_prefetched_objects_cache', None)
+        prefetch_related_objects(
+            instances,
+            *[field.name for field in model._meta.many_to_many]
+        )
+
+    def create(self, validated_data):
+        """ Insert the objects and their relations in batches """
+        model = self.child.Meta.model
+        relations = [self._pop_related(attrs) for attrs in validated_data]
+        instances = bulk_create(
+            model,
+            [model(**attrs) for attrs in validated_data]
+        )
+        self._set_related(instances, relations)
 
-class TagSerializer(serializers.ModelSerializer):
+        return instances
+
+    def update(self, instances, validated_data):
+        """ Update the objects and their relations in batches """
+        relations = []
+        fields = {'updated_at'}
+        now = timezone.now()
+        for instance, attrs in zip(instances, validated_data):
+            relations.append(self._pop_related(attrs))
+            for attr, value in attrs.items():
+                setattr(instance, attr, value)
+                fields.add(attr)
+            # bulk_update does not apply auto_now
+            instance.updated_at = now
+
+        self.child.Meta.model.objects.bulk_update(instances, fields)
+        self._set_related(instances, relations)
+
+        return instances
+
+
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for tag objects """
 
     class Meta:
         model = Tag
         fields = ('id', 'name')
         read_only_fields = ('id',)
+        list_serializer_class = BulkListSerializer
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for ingredient objects """
 
     class Meta:
         model = Ingredient
         fields = ('id', 'name')
         read_only_fields = ('id',)
+        list_serializer_class = BulkListSerializer
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serialize a recipe """
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -36,10 +119,13 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'title', 'ingredients', 'tags', 'time_minutes',
-            'price', 'link',
+            'price', 'link', 'image_thumbnail', 'image_medium', 'image_webp',
         )
         # prevent user from updating the id when making edit/create requests
-        read_only_fields = ('id',)
+        read_only_fields = (
+            'id', 'image_thumbnail', 'image_medium', 'image_webp',
+        )
+        list_serializer_class = BulkListSerializer
 
 
 class RecipeDetailSerializer(RecipeSerializer):
@@ -49,10 +135,16 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for uploading images to recipes """
 
     class Meta:
         model = Recipe
         fields = ('id', 'image')
         read_only_fields = ('id',)
+
+    def validate_image(self, value):
+        """ Check the dimensions of the complete image """
+        # The header may have been checked from a partial upload only
+        check_image_dimensions(value)
+        return value
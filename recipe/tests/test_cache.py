@@ -0,0 +1,137 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.cache import check_shared_caches
+from core.models import Tag, Ingredient, Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+LOCAL_CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+}}
+
+
+def sample_recipe(user, **params):
+    """ Create and return a sample recipe """
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+@override_settings(RECIPE_API_CACHE_TIMEOUT=300)
+class ResponseCacheTests(TestCase):
+    """ Test the per-user list response cache """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_served_from_cache(self):
+        """ Test repeating a list request does not query the database """
+        sample_recipe(user=self.user)
+        res1 = self.client.get(RECIPES_URL)
+
+        # Only the conditional request state is queried
+        with self.assertNumQueries(1):
+            res2 = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.data, res2.data)
+
+    def test_query_params_cached_separately(self):
+        """ Test different query parameters are cached separately """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+        sample_recipe(user=self.user, title='Steak')
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL, {'tags': tag.id})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_save_invalidates_cache(self):
+        """ Test creating an object invalidates the owner's lists """
+        self.client.get(TAGS_URL)
+
+        Tag.objects.create(user=self.user, name='Dessert')
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_m2m_change_invalidates_cache(self):
+        """ Test changing recipe relations invalidates the owner's lists """
+        recipe = sample_recipe(user=self.user)
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        self.client.get(RECIPES_URL)
+
+        recipe.ingredients.add(ingredient)
+        res = self.client.get(RECIPES_URL)
+
+        results = res.data['results']
+        self.assertEqual(results[0]['ingredients'], [ingredient.id])
+
+    def test_cache_limited_to_user(self):
+        """ Test other users' changes do not reach the user's cache """
+        user2 = get_user_model().objects.create_user(
+            'other@londonappdev.com',
+            'testpass'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        Tag.objects.create(user=user2, name='Fruity')
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    @override_settings(RECIPE_API_CACHE_TIMEOUT=0)
+    def test_cache_off(self):
+        """ Test lists are not cached with a timeout of 0 """
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(1):
+            self.client.get(TAGS_URL)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class SharedCacheTests(SimpleTestCase):
+    """ Test the response cache refuses a cache local to the process """
+
+    @override_settings(RECIPE_API_CACHE_TIMEOUT=300, CACHES=LOCAL_CACHES)
+    def test_local_memory_refused(self):
+        """ Test caching responses in local memory fails to start """
+        with self.assertRaises(ImproperlyConfigured):
+            check_shared_caches()
+
+    @override_settings(RECIPE_API_CACHE_TIMEOUT=0, CACHES=LOCAL_CACHES)
+    def test_local_memory_with_cache_off(self):
+        """ Test local memory is fine with response caching off """
+        check_shared_caches()
+
+    @override_settings(
+        RECIPE_API_CACHE_TIMEOUT=300,
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }}
+    )
+    def test_shared_backend(self):
+        """ Test a backend outside the process is accepted """
+        check_shared_caches()
@@ -0,0 +1,113 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """ Return the recipe detail URL """
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def sample_recipe(user, **params):
+    """ Create and return a sample recipe """
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ConditionalGetTests(TestCase):
+    """ Test conditional requests on the recipe endpoints """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_not_modified(self):
+        """ Test an unchanged list returns 304 from a single query """
+        sample_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_list_modified_after_delete(self):
+        """ Test deleting a recipe changes the list ETag """
+        sample_recipe(user=self.user)
+        recipe = sample_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        recipe.delete()
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_list_etag_matches_cached_body(self):
+        """ Test a cached list is not returned under a newer ETag """
+        recipe = sample_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        # Skips the signals, like a write the cache was not told about
+        Recipe.objects.filter(id=recipe.id).update(
+            title='Changed',
+            updated_at=timezone.now()
+        )
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['results'][0]['title'], 'Changed')
+
+    def test_detail_not_modified(self):
+        """ Test an unchanged recipe returns 304 """
+        recipe = sample_recipe(user=self.user)
+        res = self.client.get(detail_url(recipe.id))
+        self.assertIn('Last-Modified', res)
+
+        res = self.client.get(
+            detail_url(recipe.id),
+            HTTP_IF_NONE_MATCH=res['ETag']
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_modified_by_tag_change(self):
+        """ Test changing a nested tag changes the recipe ETag """
+        recipe = sample_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        etag = self.client.get(detail_url(recipe.id))['ETag']
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'Vegetarian')
+
+    def test_detail_not_found(self):
+        """ Test conditional handling keeps returning 404 for bad ids """
+        res = self.client.get(detail_url('abc'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -1,21 +1,32 @@
+import csv
+import json
 import tempfile
 import os
 
+from unittest.mock import patch
+
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core import images
+from core.images import ContentAddressedStorage, release_image
 from core.models import Recipe, Tag, Ingredient
+from core.uploads import HEADER_LIMIT, ResumableUpload
 
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.pagination import RecipeCursorPagination
 
 
 RECIPES_URL = reverse('recipe:recipe-list')
+RECIPES_BULK_URL = reverse('recipe:recipe-bulk')
+RECIPES_EXPORT_URL = reverse('recipe:recipe-export')
 
 
 def image_upload_url(recipe_id):
@@ -86,7 +97,7 @@ class PrivateRecipeApiTests(TestCase):
         # many=True will return the data from the db as a list
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         """ Test retrieving recipes for user """
@@ -104,8 +115,8 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_view_recipe_detail(self):
         """ Test viewing a recipe detail """
@@ -211,6 +222,331 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def _create_related_recipes(self, count):
+        """ Create recipes which each have a tag and an ingredient """
+        for i in range(count):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'Ingredient {i}')
+            )
+
+    def test_list_recipes_constant_queries(self):
+        """ Test listing recipes does not query once per recipe """
+        self._create_related_recipes(2)
+        # One query for the conditional request state, one for the recipes
+        #  plus one prefetch per related field
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 2)
+
+        self._create_related_recipes(8)
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 10)
+
+    def test_view_recipe_detail_constant_queries(self):
+        """ Test viewing a recipe detail prefetches tags and ingredients """
+        recipe = sample_recipe(user=self.user)
+        for i in range(5):
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'Ingredient {i}')
+            )
+
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(len(res.data['tags']), 5)
+        self.assertEqual(len(res.data['ingredients']), 5)
+
+    def test_list_recipes_paginated_by_cursor(self):
+        """ Test following the cursor returns every recipe once in order """
+        recipes = [
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(5)
+        ]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            self.assertLessEqual(len(res.data['results']), 2)
+            ids.extend(recipe['id'] for recipe in res.data['results'])
+
+        self.assertEqual(ids, [recipe.id for recipe in reversed(recipes)])
+
+    def test_list_recipes_page_size_capped(self):
+        """ Test the requested page size cannot exceed the maximum """
+        paginator = RecipeCursorPagination()
+        for i in range(paginator.max_page_size + 1):
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'page_size': paginator.max_page_size + 1}
+        )
+
+        self.assertEqual(
+            len(res.data['results']),
+            paginator.max_page_size
+        )
+        self.assertIsNotNone(res.data['next'])
+
+
+class BulkRecipeApiTests(TestCase):
+    """ Test the bulk recipe API """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_recipes(self):
+        """ Test creating many recipes with their relations """
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        payload = [
+            {
+                'title': f'Recipe {i}',
+                'tags': [tag.id],
+                'ingredients': [ingredient.id],
+                'time_minutes': 10,
+                'price': '5.00'
+            }
+            for i in range(3)
+        ]
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 3)
+        for recipe in recipes:
+            self.assertEqual(list(recipe.tags.all()), [tag])
+            self.assertEqual(list(recipe.ingredients.all()), [ingredient])
+
+    def test_bulk_create_invalid_item(self):
+        """ Test an invalid item rejects the batch with per-item errors """
+        item = {'tags': [], 'ingredients': [], 'price': '5.00'}
+        payload = [
+            {**item, 'title': 'Valid', 'time_minutes': 10},
+            {**item, 'title': 'Invalid'},
+        ]
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('time_minutes', res.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update_recipes(self):
+        """ Test updating many recipes and their relations """
+        recipe1 = sample_recipe(user=self.user)
+        recipe2 = sample_recipe(user=self.user)
+        recipe2.tags.add(sample_tag(user=self.user))
+        new_tag = sample_tag(user=self.user, name='Curry')
+        payload = [
+            {'id': recipe1.id, 'title': 'Chicken tikka'},
+            {'id': recipe2.id, 'tags': [new_tag.id]},
+        ]
+        res = self.client.patch(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        self.assertEqual(recipe1.title, 'Chicken tikka')
+        self.assertEqual(list(recipe2.tags.all()), [new_tag])
+        self.assertEqual(res.data[1]['tags'], [new_tag.id])
+
+    def test_bulk_update_other_users_recipe(self):
+        """ Test recipes of other users cannot be bulk updated """
+        user2 = get_user_model().objects.create_user(
+            'other@londonappdev.com',
+            'password213'
+        )
+        recipe = sample_recipe(user=user2)
+        payload = [{'id': recipe.id, 'title': 'Stolen'}]
+        res = self.client.patch(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Sample recipe')
+
+    def test_bulk_delete_recipes(self):
+        """ Test deleting many recipes reports each id """
+        recipe1 = sample_recipe(user=self.user)
+        recipe2 = sample_recipe(user=self.user)
+        payload = {'ids': [recipe1.id, recipe2.id, 0]}
+        res = self.client.delete(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': recipe1.id, 'deleted': True},
+            {'id': recipe2.id, 'deleted': True},
+            {'id': 0, 'deleted': False},
+        ])
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(BULK_MAX_ITEMS=2)
+    def test_bulk_too_many_items(self):
+        """ Test bulk requests above the item limit are rejected """
+        item = {
+            'title': 'Recipe', 'tags': [], 'ingredients': [],
+            'time_minutes': 10, 'price': '5.00'
+        }
+        res = self.client.post(RECIPES_BULK_URL, [item] * 3, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+        recipe = sample_recipe(user=self.user)
+        payload = {'ids': [recipe.id, 0, 1]}
+        res = self.client.delete(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+
+class RecipeExportApiTests(TestCase):
+    """ Test streaming the recipe export """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user, title='Thai curry')
+        self.recipe.tags.add(sample_tag(user=self.user, name='Vegan'))
+        self.recipe.tags.add(sample_tag(user=self.user, name='Dinner'))
+        self.recipe.ingredients.add(sample_ingredient(user=self.user))
+        sample_recipe(user=self.user, title='Toast')
+
+    def _content(self, res):
+        return b''.join(res.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """ Test exporting recipes as one JSON document per line """
+        res = self.client.get(RECIPES_EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in self._content(res).splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1]['title'], 'Thai curry')
+        self.assertEqual(lines[1]['tags'], ['Dinner', 'Vegan'])
+        self.assertEqual(lines[1]['ingredients'], ['Cinnamon'])
+        self.assertEqual(lines[0]['tags'], [])
+
+    def test_export_csv(self):
+        """ Test exporting recipes as CSV """
+        res = self.client.get(RECIPES_EXPORT_URL, {'type': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(self._content(res).splitlines()))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1]['tags'], 'Dinner|Vegan')
+        self.assertEqual(rows[1]['price'], '5.00')
+
+    def test_export_limited_to_user(self):
+        """ Test other users' recipes are not exported """
+        user2 = get_user_model().objects.create_user(
+            'other@londonappdev.com',
+            'password213'
+        )
+        sample_recipe(user=user2)
+
+        res = self.client.get(RECIPES_EXPORT_URL)
+
+        self.assertEqual(len(self._content(res).splitlines()), 2)
+
+    def test_export_invalid_type(self):
+        """ Test an unknown export type is rejected """
+        res = self.client.get(RECIPES_EXPORT_URL, {'type': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeSearchApiTests(TestCase):
+    """ Test searching recipes """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.curry = sample_recipe(user=self.user, title='Thai prawn curry')
+        self.toast = sample_recipe(user=self.user, title='Beans on toast')
+
+    def _titles(self, params):
+        res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in res.data['results']]
+
+    def test_search_recipes_by_title(self):
+        """ Test searching returns the recipes matching the title """
+        self.assertEqual(self._titles({'search': 'curry'}), [self.curry.title])
+
+    def test_search_pages_with_tied_ranks(self):
+        """ Test every search result is on exactly one page """
+        recipes = [
+            sample_recipe(user=self.user, title='Chicken curry')
+            for _ in range(7)
+        ]
+
+        ids = []
+        res = self.client.get(
+            RECIPES_URL, {'search': 'chicken', 'page_size': 3}
+        )
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            ids.extend(recipe['id'] for recipe in res.data['results'])
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sorted(ids), sorted(recipe.id for recipe in recipes))
+        # Equally relevant results are newest first
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_search_invalid_mode(self):
+        """ Test an unknown search mode is rejected """
+        res = self.client.get(
+            RECIPES_URL,
+            {'search': 'curry', 'search_mode': 'regex'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_recipes_by_related_names(self):
+        """ Test searching matches tag and ingredient names, ranked """
+        self.toast.ingredients.add(sample_ingredient(user=self.user,
+                                                     name='Curry powder'))
+        self.curry.tags.add(sample_tag(user=self.user, name='Spicy'))
+
+        self.assertEqual(
+            self._titles({'search': 'curry'}),
+            [self.curry.title, self.toast.title]
+        )
+        self.assertEqual(self._titles({'search': 'spicy'}), [self.curry.title])
+
+    def test_search_recipes_trigram(self):
+        """ Test the trigram mode tolerates typos in the title """
+        titles = self._titles(
+            {'search': 'prawm cury', 'search_mode': 'trigram'}
+        )
+
+        self.assertEqual(titles, [self.curry.title])
+
 
 class RecipeImageUploadTests(TestCase):
 
@@ -224,7 +560,12 @@ class RecipeImageUploadTests(TestCase):
         self.recipe = sample_recipe(user=self.user)
 
     def tearDown(self):
+        self.recipe.refresh_from_db()
+        self.recipe.image_thumbnail.delete()
+        self.recipe.image_medium.delete()
+        self.recipe.image_webp.delete()
         self.recipe.image.delete()
+        ResumableUpload(f'{self.user.id}-{self.recipe.id}').discard()
 
     def test_upload_image_to_recipe(self):
         """ Test uploading an image to recipe """
@@ -240,6 +581,248 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    @override_settings(TASK_RUNNER='core.tasks.ImmediateRunner')
+    def test_upload_image_generates_renditions(self):
+        """ Test uploading an image generates the smaller renditions """
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', (800, 400))
+            img.save(ntf, format='JPEG')
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        with Image.open(self.recipe.image_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (150, 75))
+        with Image.open(self.recipe.image_webp.path) as webp:
+            self.assertEqual(webp.format, 'WEBP')
+        self.assertTrue(os.path.exists(self.recipe.image_medium.path))
+
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertTrue(
+            res.data['image_thumbnail'].endswith(
+                self.recipe.image_thumbnail.url
+            )
+        )
+
+    def _image_bytes(self, size=(10, 10)):
+        """ Return the bytes of a JPEG image """
+        with tempfile.TemporaryFile() as file:
+            Image.new('RGB', size).save(file, format='JPEG')
+            file.seek(0)
+            return file.read()
+
+    def _put_chunk(self, data, start, total):
+        return self.client.put(
+            image_upload_url(self.recipe.id),
+            data,
+            content_type='image/jpeg',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(data) - 1}/{total}'
+        )
+
+    def test_upload_image_in_chunks(self):
+        """ Test uploading an image in resumable chunks """
+        data = self._image_bytes()
+        middle = len(data) // 2
+
+        res = self._put_chunk(data[:middle], 0, len(data))
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['received'], middle)
+
+        res = self._put_chunk(data[middle:], middle, len(data))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image.name.startswith('uploads/recipe/'))
+        self.assertTrue(self.recipe.image.name.endswith('.jpg'))
+        with open(self.recipe.image.path, 'rb') as file:
+            self.assertEqual(file.read(), data)
+
+    def test_upload_image_chunk_out_of_order(self):
+        """ Test a chunk not continuing the upload is rejected """
+        data = self._image_bytes()
+        self._put_chunk(data[:10], 0, len(data))
+
+        res = self._put_chunk(data[20:], 20, len(data))
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    @override_settings(MAX_IMAGE_UPLOAD_SIZE=100)
+    def test_upload_image_chunk_too_large(self):
+        """ Test uploads announcing a size over the limit are rejected """
+        res = self._put_chunk(b'x' * 10, 0, 101)
+
+        self.assertEqual(res.status_code, 413)
+
+    @override_settings(MAX_IMAGE_DIMENSION=5)
+    def test_upload_image_dimensions_too_large(self):
+        """ Test images over the dimension limit are rejected early """
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(self._image_bytes())
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, 413)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(MAX_IMAGE_DIMENSION=5)
+    @patch('core.uploads.check_image_header', return_value=False)
+    def test_upload_image_dimensions_checked_after_upload(self, header):
+        """ Test the complete image is checked when its header was not """
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(self._image_bytes())
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertTrue(header.called)
+        self.assertEqual(res.status_code, 413)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_image_header_unreadable(self):
+        """ Test uploads without dimensions in their header are rejected """
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(b'x' * (HEADER_LIMIT + 1))
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data['image'], ['Image dimensions could not be read.']
+        )
+
+        res = self._put_chunk(b'x' * HEADER_LIMIT, 0, HEADER_LIMIT + 10)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        upload = ResumableUpload(f'{self.user.id}-{self.recipe.id}')
+        self.assertEqual(upload.received, 0)
+
+    @override_settings(
+        RECIPE_IMAGE_CONTENT_ADDRESSED=True,
+        TASK_RUNNER='core.tasks.ImmediateRunner'
+    )
+    def test_upload_image_content_addressed(self):
+        """ Test identical images are stored once and released with use """
+        recipe2 = sample_recipe(user=self.user)
+        data = self._image_bytes()
+        for recipe in (self.recipe, recipe2):
+            with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+                ntf.write(data)
+                ntf.seek(0)
+                self.client.post(
+                    image_upload_url(recipe.id),
+                    {'image': ntf},
+                    format='multipart'
+                )
+
+        self.recipe.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, recipe2.image.name)
+        self.assertIn(self.recipe.image_hash, self.recipe.image.name)
+        path = self.recipe.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe2.delete()
+        self.assertTrue(os.path.exists(path))
+
+        # Replacing the image of the last recipe using it deletes the file
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(self._image_bytes(size=(20, 20)))
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(
+                    image_upload_url(self.recipe.id),
+                    {'image': ntf},
+                    format='multipart'
+                )
+        self.assertFalse(os.path.exists(path))
+
+    def _upload_content_addressed(self, recipe, data):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(data)
+            ntf.seek(0)
+            self.client.post(
+                image_upload_url(recipe.id),
+                {'image': ntf},
+                format='multipart'
+            )
+        recipe.refresh_from_db()
+
+    @override_settings(RECIPE_IMAGE_CONTENT_ADDRESSED=True)
+    def test_release_waits_for_concurrent_upload(self):
+        """ Test a release sees an upload committed while it waited """
+        self._upload_content_addressed(self.recipe, self._image_bytes())
+        name, path = self.recipe.image.name, self.recipe.image.path
+        recipe2 = sample_recipe(user=self.user)
+        Recipe.objects.filter(id=self.recipe.id).update(image='')
+        lock_image = images.lock_image
+
+        def upload_commits_first(image_hash):
+            # The upload reusing the image commits while the release waits
+            #  for the lock it holds
+            Recipe.objects.filter(id=recipe2.id).update(
+                image=name, image_hash=image_hash
+            )
+            lock_image(image_hash)
+
+        with patch('core.images.lock_image', side_effect=upload_commits_first):
+            release_image(name)
+
+        self.assertTrue(os.path.exists(path))
+        Recipe.objects.filter(id=recipe2.id).update(image='')
+        release_image(name)
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(RECIPE_IMAGE_CONTENT_ADDRESSED=True)
+    def test_upload_after_concurrent_release(self):
+        """ Test an upload stores the image a release just deleted """
+        data = self._image_bytes()
+        self._upload_content_addressed(self.recipe, data)
+        name = self.recipe.image.name
+        recipe2 = sample_recipe(user=self.user)
+        lock_image = images.lock_image
+        released = []
+
+        def release_commits_first(image_hash):
+            # The release of the image commits before the upload locks it
+            if not released:
+                released.append(image_hash)
+                Recipe.objects.filter(id=self.recipe.id).update(image='')
+                release_image(name)
+            lock_image(image_hash)
+
+        with patch('core.images.lock_image',
+                   side_effect=release_commits_first):
+            self._upload_content_addressed(recipe2, data)
+
+        self.assertTrue(released)
+        self.assertEqual(recipe2.image.name, name)
+        with open(recipe2.image.path, 'rb') as file:
+            self.assertEqual(file.read(), data)
+        recipe2.image.delete()
+
+    def test_content_addressed_storage_keeps_name(self):
+        """ Test concurrent first writes of a name store a single file """
+        storage = ContentAddressedStorage()
+        name = 'uploads/recipe/test-content-addressed.jpg'
+        self.addCleanup(storage.delete, name)
+
+        # Both writers missed the other's file
+        with patch.object(storage, 'exists', return_value=False):
+            first = storage.save(name, ContentFile(b'image'))
+            second = storage.save(name, ContentFile(b'image'))
+
+        self.assertEqual((first, second), (name, name))
+        self.assertEqual(
+            [file for file in storage.listdir('uploads/recipe')[1]
+             if file.startswith('test-content-addressed')],
+            ['test-content-addressed.jpg']
+        )
+
     def test_upload_image_bad_request(self):
         """ Test uploading an invalid image """
         url = image_upload_url(self.recipe.id)
@@ -269,9 +852,9 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_recipes_by_ingredients(self):
         """ Test returning recipes with specific ingredients """
@@ -292,6 +875,45 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+    def test_filter_recipes_by_all_ingredients(self):
+        """ Test returning recipes containing all of the ingredients """
+        recipe1 = sample_recipe(user=self.user, title='Cheese on toast')
+        recipe2 = sample_recipe(user=self.user, title='Toast')
+        ingredient1 = sample_ingredient(user=self.user, name='Bread')
+        ingredient2 = sample_ingredient(user=self.user, name='Cheese')
+        recipe1.ingredients.add(ingredient1, ingredient2)
+        recipe2.ingredients.add(ingredient1)
+
+        res = self.client.get(
+            RECIPES_URL,
+            {
+                'ingredients': f'{ingredient1.id},{ingredient2.id}',
+                'match': 'all'
+            }
+        )
+
+        serializer1 = RecipeSerializer(recipe1)
+        serializer2 = RecipeSerializer(recipe2)
+        self.assertEqual(res.data['results'], [serializer1.data])
+        self.assertNotIn(serializer2.data, res.data['results'])
+
+    def test_filter_recipes_by_any_tags_unique(self):
+        """ Test recipes matching several of the tags are returned once """
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_filter_recipes_invalid_match(self):
+        """ Test an unknown match mode is rejected """
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -10,6 +10,7 @@ from core.models import Tag, Recipe
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
+TAGS_BULK_URL = reverse('recipe:tag-bulk')
 
 
 class PublicTagsApiTests(TestCase):
@@ -45,7 +46,7 @@ class PrivateTagsApiTests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """ Test that tags returned are for the authenticated user """
@@ -58,8 +59,8 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
 
     def test_create_tag_successful(self):
         """ test creating a new tag """
@@ -95,8 +96,8 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_retrieve_tags_assigned_unique(self):
         """ Test filtering tags by assigned returns unique items """
@@ -119,7 +120,7 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
 
     def test_retrieve_tags_assigned_unique(self):
         """ Test filtering tags by assigned returns unique items """
@@ -143,4 +144,53 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_retrieve_tags_assigned_single_query(self):
+        """ Test filtering tags by assigned is answered in one query """
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        for title in ('Pancakes', 'Porridge', 'Waffles'):
+            recipe = Recipe.objects.create(
+                title=title,
+                time_minutes=5,
+                price=3.00,
+                user=self.user
+            )
+            recipe.tags.add(tag)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_bulk_create_tags(self):
+        """ Test creating many tags in one request """
+        payload = [{'name': 'Vegan'}, {'name': 'Dessert'}]
+        res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        names = Tag.objects.filter(user=self.user).values_list(
+            'name', flat=True
+        )
+        self.assertEqual(sorted(names), ['Dessert', 'Vegan'])
+
+    def test_bulk_update_tags_touches_recipes(self):
+        """ Test renaming tags in bulk changes the nesting recipes """
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = Recipe.objects.create(
+            title='Pancakes',
+            time_minutes=5,
+            price=3.00,
+            user=self.user
+        )
+        recipe.tags.add(tag)
+        updated_at = Recipe.objects.get(id=recipe.id).updated_at
+
+        payload = [{'id': tag.id, 'name': 'Brunch'}]
+        res = self.client.patch(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Brunch')
+        recipe.refresh_from_db()
+        self.assertGreater(recipe.updated_at, updated_at)
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from core.async_views import async_read_urls
 from recipe import views
 
 router = DefaultRouter()
@@ -8,8 +10,16 @@ router.register('tags', views.TagViewSet)
 router.register('ingredients', views.IngredientViewSet)
 router.register('recipes', views.RecipeViewSet)
 
+# The read heavy endpoints, served without the shared thread under ASGI
+ASYNC_READ_URLS = ('recipe-list', 'recipe-detail', 'tag-list',
+                   'ingredient-list')
+
+urls = router.urls
+if settings.ASYNC_READ_VIEWS:
+    urls = async_read_urls(urls, ASYNC_READ_URLS)
+
 app_name = 'recipe'
 
 urlpatterns = [
-    path('', include(router.urls))
+    path('', include(urls))
 ]
@@ -1,20 +1,43 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
+from core.authentication import CachedTokenAuthentication
+from core.images import content_addressed_image, release_image, \
+                        schedule_renditions
 from core.models import Tag, Ingredient, Recipe
+from core.search import search_recipes, update_search_vectors
+from core.throttling import UserBucketThrottle, ScopedBucketThrottle
+from core.uploads import ImageUploadHandler, ResumableUpload
 
-from recipe import serializers
+from recipe import export, serializers
+from recipe.mixins import BulkMixin, CachedListMixin, ConditionalGetMixin, \
+                          ReplicaReadMixin
+from recipe.pagination import RecipeCursorPagination, \
+                              RecipeAttrCursorPagination, \
+                              RecipeSearchPagination
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(ReplicaReadMixin,
+                            BulkMixin,
+                            CachedListMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """ Base viewset for user owned recipe attributes """
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeAttrCursorPagination
+    # Name of the Recipe many-to-many field the attribute is assigned with
+    recipe_field = None
 
     # Here we are filtering tags to only the authenticated user
     def get_queryset(self):
@@ -24,58 +47,158 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
         )
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            # Check the through table with EXISTS rather than joining every
+            #  recipe and de-duplicating the rows afterwards
+            field = Recipe._meta.get_field(self.recipe_field)
+            queryset = queryset.filter(Exists(
+                field.remote_field.through.objects.filter(
+                    **{field.m2m_reverse_name(): OuterRef('pk')}
+                )
+            ))
 
         return queryset.filter(
                user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by('-name')
 
     def perform_create(self, serializer):
         """ Create a new object """
         serializer.save(user=self.request.user)
 
+    def perform_bulk_update(self, serializer):
+        """ Update objects and the recipes they are nested in """
+        instances = serializer.save()
+        # bulk_update skips the signals which update the nesting recipes
+        recipe_ids = list(Recipe.objects.filter(
+            **{f'{self.recipe_field}__in': instances}
+        ).values_list('id', flat=True).distinct())
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            updated_at=timezone.now()
+        )
+        update_search_vectors(recipe_ids)
+
 
 # Now we just have code that makes each viewset unique
 class TagViewSet(BaseRecipeAttrViewSet):
     """ Manage tags in the database """
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    recipe_field = 'tags'
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """ Manage ingredients in the database """
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    recipe_field = 'ingredients'
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin,
+                    BulkMixin,
+                    ConditionalGetMixin,
+                    CachedListMixin,
+                    viewsets.ModelViewSet):
     """ Manage recipes in the database """
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeCursorPagination
+    throttle_classes = (UserBucketThrottle, ScopedBucketThrottle)
+    throttle_scope = 'recipe'
+
+    @property
+    def paginator(self):
+        """ Page search results by offset instead of a cursor """
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('search'):
+                self._paginator = RecipeSearchPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def _params_to_ints(self, qs):
         """ Convert a list of string IDs to a list of integers """
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _filter_related(self, queryset, through, column, ids, match):
+        """ Filter recipes by ids of a related object in the through table """
+        if match == 'all':
+            # Group the through rows matching any of the ids by recipe and
+            #  keep the recipes matching every id, this is answered from the
+            #  (related id, recipe id) index without joining the recipes
+            ids = set(ids)
+            matching = through.objects.filter(
+                **{f'{column}__in': ids}
+            ).values('recipe_id').annotate(
+                matches=Count(column)
+            ).filter(matches=len(ids)).values('recipe_id')
+            return queryset.filter(id__in=matching)
+
+        # EXISTS instead of a join so a recipe is only returned once however
+        #  many of the ids it matches
+        return queryset.filter(Exists(through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            **{f'{column}__in': ids}
+        )))
+
+    def _prefetch_related(self, queryset):
+        """ Prefetch the related objects the action's serializer needs """
+        if self.action == 'retrieve':
+            # The detail serializer nests full tag and ingredient objects
+            return queryset.prefetch_related('tags', 'ingredients')
+        elif self.action in ('upload_image', 'export'):
+            return queryset
+
+        # The list serializer only renders primary keys, so only load the ids
+        #  instead of whole rows for every related object
+        return queryset.prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('id')),
+            Prefetch('ingredients', queryset=Ingredient.objects.only('id')),
+        )
+
     def get_queryset(self):
         """ Retrieve the recipes for the authenticated user """
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('search')
+        search_mode = self.request.query_params.get('search_mode', 'fulltext')
+        if search_mode not in ('fulltext', 'trigram'):
+            raise ValidationError(
+                {'search_mode': "Must be 'fulltext' or 'trigram'."}
+            )
+        # Return recipes matching 'any' of the ids by default, or 'all' of them
+        match = self.request.query_params.get('match', 'any')
+        if match not in ('any', 'all'):
+            raise ValidationError({'match': "Must be 'any' or 'all'."})
+
         queryset = self.queryset
+        if search:
+            # Annotates the relevance as 'rank', used to order the results
+            queryset = search_recipes(queryset, search, search_mode)
+
         if tags:
             # Convert to list of ids
             tag_ids = self._params_to_ints(tags)
-            # django syntax for filtering on foreign key objects
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = self._filter_related(
+                queryset, Recipe.tags.through, 'tag_id', tag_ids, match
+            )
 
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = self._filter_related(
+                queryset,
+                Recipe.ingredients.through,
+                'ingredient_id',
+                ingredient_ids,
+                match
+            )
+
+        queryset = self._prefetch_related(queryset)
+        # The id breaks ties between equally relevant search results
+        ordering = ('-rank', '-id') if search else ('-id',)
 
         # code deviation after .order_by...
-        return queryset.filter(user=self.request.user).order_by('-id')
+        return queryset.filter(user=self.request.user).order_by(*ordering)
 
     def get_serializer_class(self):
         """ Return appropriate serializer class """
@@ -90,17 +213,83 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """ Create a new recipe """
         serializer.save(user=self.request.user)
 
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    def perform_bulk_create(self, serializer):
+        """ Create recipes and build their search vectors """
+        recipes = serializer.save(user=self.request.user)
+        update_search_vectors([recipe.id for recipe in recipes])
+
+    def perform_bulk_update(self, serializer):
+        """ Update recipes and rebuild their search vectors """
+        recipes = serializer.save()
+        update_search_vectors([recipe.id for recipe in recipes])
+
+    @action(methods=['POST', 'PUT'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
-        """ Upload an image to a recipe """
+        """ Upload an image to a recipe
+
+        POST a multipart form, or PUT the raw image in one or more chunks
+        described by a Content-Range header to resume large uploads.
+        """
         recipe = self.get_object()
+        if request.method == 'PUT':
+            return self._upload_image_chunk(request, recipe)
+
+        # Spool the file to disk and check its size and dimensions while it
+        #  is received, so it is never buffered in memory
+        request._request.upload_handlers = [
+            ImageUploadHandler(request._request)
+        ]
+        return self._save_image(recipe, request.data)
+
+    def _upload_image_chunk(self, request, recipe):
+        """ Receive a chunk of an image streamed in the request body """
+        upload = ResumableUpload(f'{request.user.id}-{recipe.id}')
+        complete = upload.receive(
+            request.stream,
+            request.META.get('HTTP_CONTENT_RANGE'),
+            int(request.META.get('CONTENT_LENGTH') or 0)
+        )
+        if not complete:
+            return Response(
+                {'received': upload.received},
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        image = upload.assembled()
+        try:
+            return self._save_image(recipe, {'image': image})
+        finally:
+            image.close()
+            upload.discard()
+
+    def _save_image(self, recipe, data):
+        """ Validate and store an uploaded image """
         serializer = self.get_serializer(
             recipe,
-            data=request.data
+            data=data
         )
 
         if serializer.is_valid():
-            serializer.save()
+            previous_image = recipe.image.name
+            with transaction.atomic():
+                fields = {}
+                if settings.RECIPE_IMAGE_CONTENT_ADDRESSED:
+                    fields = content_addressed_image(
+                        serializer.validated_data['image']
+                    )
+
+                # Drop the renditions of the previous image, the new ones
+                #  are generated in the background once the upload commits
+                recipe = serializer.save(
+                    image_thumbnail=None,
+                    image_medium=None,
+                    image_webp=None,
+                    **fields
+                )
+            transaction.on_commit(lambda: schedule_renditions(recipe))
+            if settings.RECIPE_IMAGE_CONTENT_ADDRESSED and \
+                    previous_image != recipe.image.name:
+                transaction.on_commit(lambda: release_image(previous_image))
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -110,3 +299,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """ Stream all the recipes as NDJSON (default) or CSV """
+        # The 'format' query parameter is reserved by DRF to pick a renderer
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type == 'csv':
+            content, content_type = export.iter_csv, 'text/csv'
+        elif export_type == 'ndjson':
+            content, content_type = export.iter_ndjson, 'application/x-ndjson'
+        else:
+            raise ValidationError({'type': "Must be 'ndjson' or 'csv'."})
+
+        recipes = export.iter_recipes(self.get_queryset())
+        response = StreamingHttpResponse(
+            content(recipes),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="recipes.{export_type}"'
+
+        return response
@@ -3,8 +3,10 @@ from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import serializers
 
+from core.metrics import TimedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for the users object """
 
     class Meta:
@@ -1,12 +1,19 @@
+from unittest.mock import patch
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.urls import reverse
+from django.utils import timezone
 
 # Test client used to make requests to API and check response
 from rest_framework.test import APIClient
 # Get human-readable test codes
 from rest_framework import status
 
+from core.hashers import get_pool
+from core.models import AuthToken
+
 # Create a 'create user' url and assign it to this variable
 #  -> This will cause an error until we wire up the URLs to the user view
 CREATE_USER_URL = reverse('user:create')
@@ -16,6 +23,7 @@ TOKEN_URL = reverse('user:token')
 # The url for the specific user where they have access to their profile
 #  information
 ME_URL = reverse('user:me')
+ROTATE_TOKEN_URL = reverse('user:token-rotate')
 
 
 # dynamic list of arguments to pass directly into the create user model
@@ -107,6 +115,78 @@ class PublicUserApiTests(TestCase):
         self.assertNotIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_token_reuses_valid_token(self):
+        """ Test logging in again returns the same unexpired token """
+        payload = {'email': 'test@londonappdev.com', 'password': 'testpass'}
+        create_user(**payload)
+
+        first = self.client.post(TOKEN_URL, payload)
+        second = self.client.post(TOKEN_URL, payload)
+
+        self.assertIn('expires_at', first.data)
+        self.assertEqual(first.data['token'], second.data['token'])
+
+    def test_create_token_replaces_expired_token(self):
+        """ Test logging in after expiry issues a new token """
+        payload = {'email': 'test@londonappdev.com', 'password': 'testpass'}
+        user = create_user(**payload)
+        expired = AuthToken.objects.issue(user)
+        AuthToken.objects.filter(pk=expired.pk).update(
+            expires_at=timezone.now()
+        )
+
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertNotEqual(res.data['token'], expired.key)
+        self.assertEqual(AuthToken.objects.get(user=user).key,
+                         res.data['token'])
+
+    def test_rotate_token(self):
+        """ Test rotating replaces the token used to authenticate """
+        user = create_user(email='test@londonappdev.com', password='testpass')
+        token = AuthToken.objects.issue(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        res = self.client.post(ROTATE_TOKEN_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['token'], token.key)
+        # The old key stops working straight away
+        self.assertEqual(
+            self.client.get(ME_URL).status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {res.data["token"]}'
+        )
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
+    def test_create_token_upgrades_password_hash(self):
+        """ Test logging in rehashes a password with the preferred hasher """
+        payload = {'email': 'test@londonappdev.com', 'password': 'testpass'}
+        user = create_user(**payload)
+        user.password = make_password('testpass', hasher='pbkdf2_sha256')
+        user.save()
+
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$'))
+        self.assertTrue(user.check_password('testpass'))
+
+    def test_create_token_hash_pool_busy(self):
+        """ Test logins are refused when the hash pool is saturated """
+        payload = {'email': 'test@londonappdev.com', 'password': 'testpass'}
+        create_user(**payload)
+
+        with patch.object(get_pool().slots, 'acquire', return_value=False):
+            res = self.client.post(TOKEN_URL, payload)
+
+        self.assertNotIn('token', res.data)
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
     def test_create_token_no_user(self):
         """ Test htat token is not created if user does not exist """
         payload = {'email': 'test@londonappdev.com', 'password': 'testpass'}
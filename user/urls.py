@@ -1,12 +1,24 @@
+from django.conf import settings
 from django.urls import path
 
+from core.async_views import async_offload_view, login_executor
 from user import views
 
 
 app_name = 'user'
 
+# Logins block on the password hash pool, off the shared thread under ASGI
+token_view = views.CreateTokenView.as_view()
+if settings.ASYNC_READ_VIEWS:
+    token_view = async_offload_view(token_view, login_executor)
+
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
-    path('token/', views.CreateTokenView.as_view(), name='token'),
+    path('token/', token_view, name='token'),
+    path(
+        'token/rotate/',
+        views.RotateTokenView.as_view(),
+        name='token-rotate'
+    ),
     path('me/', views.ManageUserView.as_view(), name='me')
 ]
@@ -1,6 +1,12 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from core.authentication import CachedTokenAuthentication
+from core.models import AuthToken
+from core.throttling import UserBucketThrottle, ScopedBucketThrottle
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -10,19 +16,48 @@ class CreateUserView(generics.CreateAPIView):
     """ Create a new user in the system """
     # Easily create
     serializer_class = UserSerializer
+    throttle_classes = (UserBucketThrottle, ScopedBucketThrottle)
+    throttle_scope = 'user_create'
+
+
+def token_response(token):
+    """ Return the response describing a token """
+    return Response({'token': token.key, 'expires_at': token.expires_at})
 
 
 class CreateTokenView(ObtainAuthToken):
     """ Create a new auth token for user """
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken turns throttling off, login needs it most
+    throttle_classes = (UserBucketThrottle, ScopedBucketThrottle)
+    throttle_scope = 'token'
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # The valid token is reused, an expired one is replaced
+        token = AuthToken.objects.issue(serializer.validated_data['user'])
+
+        return token_response(token)
+
+
+class RotateTokenView(APIView):
+    """ Replace the authenticated token with a new one """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        token = AuthToken.objects.issue(request.user, rotate=True)
+
+        return token_response(token)
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """ Manage the authenticated user """
     serializer_class = UserSerializer
     # Gets the authenticated user
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     # When the get_object is called the request will have the user attached